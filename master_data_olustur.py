@@ -7,19 +7,38 @@ veriyi çeker ve MASTER_DATA.xlsx oluşturur.
 Kullanım:
   python master_data_olustur.py          # Normal çalıştır
   python master_data_olustur.py --izle   # Dosya değişikliği izle (watch mode)
+  python master_data_olustur.py --servis [PORT]  # İzle + bellekteki veriyi yerel HTTP ucundan sorgula
+  python master_data_olustur.py --map BOLGE_KLASORU [--cikti bolge.parca.jsonl]
+  python master_data_olustur.py --merge a.parca.jsonl b.parca.jsonl [--cikti MASTER_DATA.xlsx]
 """
 
 import re
 import sys
 import io
 import os
+import json
+import hashlib
+import time
+import zlib
+import zipfile
 import logging
+import argparse
+import copy
+import bisect
+import threading
 import openpyxl
 from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
 from openpyxl.utils import get_column_letter
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from pathlib import Path
 from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+try:
+    import numpy as np  # Opsiyonel: büyük sipariş analizini hızlandırır
+except ImportError:
+    np = None
 
 # Windows encoding fix
 if sys.platform == 'win32':
@@ -48,6 +67,28 @@ log = logging.getLogger('master_data')
 DOSYA_DIZINI = BASE_DIR          # Excel dosyalarının bulunduğu klasör
 CIKTI_DOSYA = 'MASTER_DATA.xlsx' # Çıktı dosya adı
 YEDEK_FILTRELE = True            # _YEDEK dosyaları atla
+DURUM_DOSYA = '.master_data_durum.json'  # Hızlı başlangıç için derleme durumu
+GECIKME_GUN = 30                 # Tek ziyaretli müşteri bu kadar gün ziyaret edilmezse gecikmiş sayılır
+GECIKME_KATSAYI = 1.5            # Düzenli müşteride eşik: ortalama ziyaret aralığı x katsayı
+TUTULAN_HAFTA = None             # Son N hafta detaylı tutulur, eskiler arşive katlanır (None: hepsi detaylı)
+ARSIV_DOSYA = 'MASTER_ARSIV.json'  # Arşivlenen haftaların özet deposu
+DEGISIKLIK_DOSYA = 'MASTER_DEGISIKLIK.jsonl'   # Son derlemede eklenen/silinen/değişen kayıtlar
+ANAHTAR_DOSYA = '.master_data_anahtarlar.json'  # Önceki derlemenin kayıt anahtarları
+
+# İzleme modu (--izle)
+KONTROL_ARALIGI = 5              # Klasör kaç saniyede bir kontrol edilir
+STABIL_SANIYE = 10               # Dosya boyutu/tarihi bu kadar süre değişmezse kopyalama bitmiş sayılır
+MIN_GUNCELLEME_ARALIGI = 30      # İki güncelleme arasında en az bu kadar saniye
+MAKS_GECIKME = 180               # Bekleyen değişiklik en fazla bu kadar saniye ertelenir
+YARIM_DOSYA_DENEME = 5           # Yarım (okunamayan) dosya en fazla kaç kez yeniden denenir
+
+# Servis modu (--servis)
+SERVIS_ADRES = '127.0.0.1'       # Yalnızca bu makineden erişilir
+SERVIS_PORT = 8765               # --servis ile port verilmezse kullanılır
+SORGU_LIMIT = 1000               # Sorgu yanıtındaki en fazla kayıt (limit parametresiyle değişir)
+
+# Veri kalite kuralları
+SISIK_ARALIK_SATIR = 1000        # Son veri satırından sonra bu kadar boş satır varsa sayfa aralığı şişik sayılır
 # ============================================================
 
 # Stiller
@@ -66,6 +107,7 @@ LIGHT_FILL = PatternFill('solid', fgColor='FFF5F5')
 INFO_FILL = PatternFill('solid', fgColor='E3F2FD')
 PURPLE_FILL = PatternFill('solid', fgColor='EDE7F6')
 AUTO_FILL = PatternFill('solid', fgColor='E8F5E9')
+SAYI_FORMAT = '#,##0.00'
 
 TR_MONTHS = {
     'OCAK': 1, 'SUBAT': 2, 'MART': 3, 'NISAN': 4,
@@ -110,6 +152,15 @@ def safe_str(v):
     return str(v).strip()
 
 
+def tarih_cevir(s):
+    """'GG.AA.YYYY' metnini datetime'a çevir; geçersizse None."""
+    try:
+        parts = s.split('.')
+        return datetime(int(parts[2]), int(parts[1]), int(parts[0]))
+    except (ValueError, IndexError, AttributeError):
+        return None
+
+
 def safe_date(v):
     if v is None:
         return ''
@@ -124,10 +175,59 @@ def safe_date(v):
     return s
 
 
+def sayi_cevir(v):
+    """Hücre değerini sayıya çevir (Türkçe biçim: '1.250,00 TL' -> 1250.0). Çevrilemezse None."""
+    if v is None or isinstance(v, (bool, date)):
+        return None  # Tarih hücresi (datetime da date'tir) miktar/fiyat değildir
+    if isinstance(v, (int, float)):
+        return float(v)
+    # Boşluk yalnızca rakam grupları arasında binlik ayracıdır ('12 500'); ayrı sayılar birleşmez
+    metin = re.sub(r'(?<=\d) (?=\d{3}\b)', '', str(v))
+    for m in re.finditer(r'[-+]?(?:\d[\d.,]*|[.,]\d+)', metin):  # '.5' / ',5': başta sıfır yazılmamış ondalık
+        if metin[m.start() - 1:m.start()] != '%' and metin[m.end():m.end() + 1] != '%':
+            break  # Yüzde oranları (KDV %18) tutar değildir
+    else:
+        return None
+    s = m.group().rstrip('.,')
+    if ',' in s and '.' in s:
+        # Sonda gelen ayraç ondalık ayracıdır
+        if s.rfind(',') > s.rfind('.'):
+            s = s.replace('.', '').replace(',', '.')
+        else:
+            s = s.replace(',', '')
+    elif ',' in s:
+        s = s.replace(',', '') if s.count(',') > 1 else s.replace(',', '.')
+    elif '.' in s:
+        # '1.000' / '1.250.000' binlik ayracı, '12.5' ve '0.125' ondalık kabul edilir
+        if s.count('.') > 1 or (len(s) - s.rfind('.') == 4 and not s.lstrip('+-').startswith('0.')):
+            s = s.replace('.', '')
+    try:
+        return float(s)
+    except ValueError:
+        return None
+
+
 # ============================================================
 # OTOMATİK ALGILAMA FONKSİYONLARI
 # ============================================================
 
+def dosya_izi(yol):
+    """Dosyanın değişim izi: (boyut, değişim zamanı ns)."""
+    st = yol.stat()
+    return (st.st_size, st.st_mtime_ns)
+
+
+def klasor_izleri(dizin):
+    """Klasördeki işlenecek dosyaların izlerini döndür: {dosya_adı: iz}."""
+    izler = {}
+    for fn in dosya_listesi_al(dizin):
+        try:
+            izler[fn] = dosya_izi(dizin / fn)
+        except FileNotFoundError:
+            pass  # Listeleme ile stat arasında silinmiş
+    return izler
+
+
 def dosya_listesi_al(dizin):
     """xlsx dosyalarını filtrele ve listele."""
     files = []
@@ -230,9 +330,13 @@ def temsilci_algila(dosya_listesi):
             if candidate:
                 temsilciler.add(candidate)
 
-    # Normalize edip birleştir (aynı kişinin farklı yazımlarını)
+    return temsilci_birlestir(temsilciler)
+
+
+def temsilci_birlestir(adaylar):
+    """Aynı kişinin farklı yazımlarını normalize edip tek isimde birleştir."""
     merged = {}
-    for t in temsilciler:
+    for t in sorted(adaylar):
         key = normalize_tr(t).replace(' ', '')
         if key not in merged or len(t) > len(merged[key]):
             merged[key] = t
@@ -240,6 +344,9 @@ def temsilci_algila(dosya_listesi):
     return sorted(merged.values())
 
 
+DOSYA_TIPLERI = ('Planlanan Ziyaret', 'Yapılan Ziyaret', 'Sipariş Formu')
+
+
 def dosya_tipi_bul(fn):
     """Dosya tipini otomatik algıla."""
     fn_norm = normalize_tr(fn)
@@ -290,19 +397,215 @@ def hafta_bul(fn, haftalar):
 # ANA VERİ ÇEKME
 # ============================================================
 
-def master_data_olustur():
-    xlsx_files = dosya_listesi_al(DOSYA_DIZINI)
+def musteri_ekle(customers, cust_key, musteri_val, yetkili, iletisim, lokasyon, rep, tarih_str):
+    """Müşteri master'a bir satırın katkısını işle (ilk görülen kayıt esas alınır)."""
+    if cust_key not in customers:
+        customers[cust_key] = {'name': musteri_val, 'yetkili': yetkili, 'iletisim': iletisim,
+                               'lokasyon': lokasyon, 'rep': rep, 'tarih': tarih_str}
+    else:
+        if yetkili and not customers[cust_key]['yetkili']:
+            customers[cust_key]['yetkili'] = yetkili
+        if iletisim and not customers[cust_key]['iletisim']:
+            customers[cust_key]['iletisim'] = iletisim
+        if tarih_str:
+            customers[cust_key]['tarih'] = tarih_str
+
+
+def musterileri_birlestir(hedef, kaynak):
+    """Bir dosyanın müşteri katkılarını genel müşteri master'a katla."""
+    for cust_key, c in kaynak.items():
+        if cust_key not in hedef:
+            hedef[cust_key] = dict(c)
+        else:
+            musteri_ekle(hedef, cust_key, c['name'], c['yetkili'], c['iletisim'],
+                         c['lokasyon'], c['rep'], c['tarih'])
+
+
+def dosya_oku(dizin, fn, rep, week):
+    """Tek bir Excel dosyasını oku, kayıtlarını ve müşteri katkılarını döndür."""
+    wbf = openpyxl.load_workbook(dizin / fn, data_only=True)
+    try:
+        wsf = wbf.active
+        ftype = dosya_tipi_bul(fn)
+        is_planlanan = ftype == 'Planlanan Ziyaret'
+        is_yapilan = ftype == 'Yapılan Ziyaret'
+        is_siparis_file = ftype == 'Sipariş Formu'
+
+        sonuc = {'dosya': fn, 'rep': rep, 'week': week, 'tip': ftype, 'gomulu': False,
+                 'planlanan': [], 'yapilan': [], 'siparis': [], 'musteriler': {},
+                 'satir_sayisi': wsf.max_row, 'son_veri_satiri': None}
+
+        # Header satırı ve gömülü sipariş kontrolü
+        has_embedded_siparis = False
+        header_row = None
+
+        for hr in range(1, 6):
+            vals = ' '.join([safe_str(wsf.cell(row=hr, column=c).value) for c in range(1, wsf.max_column + 1)])
+            vn = normalize_tr(vals)
+            if 'URUN' in vn and ('FIYAT' in vn or 'ADET' in vn):
+                has_embedded_siparis = True
+                header_row = hr
+                break
+            if ('LOKASYON' in vn or 'MUSTERI' in vn or 'GORUSULEN' in vn) and header_row is None:
+                header_row = hr
+
+        if header_row is None:
+            header_row = 3 if wsf.max_row > 3 else 1
+        sonuc['gomulu'] = has_embedded_siparis
+
+        # Kolon eşleştirme
+        cols = {}
+        for c in range(1, wsf.max_column + 1):
+            v = safe_str(wsf.cell(row=header_row, column=c).value)
+            vn = normalize_tr(v)
+            if ('MUSTERI' in vn or 'GORUSULEN' in vn or 'FIRMA' in vn) and 'musteri' not in cols:
+                cols['musteri'] = c
+            elif ('YETKILI' in vn or 'KISI ADI' in vn) and 'yetkili' not in cols:
+                cols['yetkili'] = c
+            elif ('ILETISIM' in vn or 'NUMARA' in vn or 'TELEFON' in vn) and 'iletisim' not in cols:
+                cols['iletisim'] = c
+            elif ('LOKASYON' in vn or vn.strip() in ('IL', 'IL)')) and 'lokasyon' not in cols:
+                cols['lokasyon'] = c
+            elif 'TARIH' in vn and 'GORUSME' not in vn and 'tarih' not in cols:
+                cols['tarih'] = c
+            elif 'GUN' in vn and 'gun' not in cols:
+                cols['gun'] = c
+            elif 'SURE' in vn and 'sure' not in cols:
+                cols['sure'] = c
+            elif 'URUN' in vn and 'urun' not in cols:
+                cols['urun'] = c
+            elif 'ADET' in vn and 'adet' not in cols:
+                cols['adet'] = c
+            elif 'FIYAT' in vn and 'fiyat' not in cols:
+                cols['fiyat'] = c
+            elif 'NOT' in vn and 'NUMARA' not in vn and 'notlar' not in cols:
+                cols['notlar'] = c
+
+        # Veri satırlarını oku
+        if 'musteri' not in cols:
+            log.warning(f"  UYARI: {fn} - 'Müşteri' kolonu bulunamadı, atlanıyor")
+            return sonuc
+
+        customers = sonuc['musteriler']
+        sonuc['son_veri_satiri'] = header_row
+        visits_seen = set()
+        last_musteri = last_yetkili = last_iletisim = last_tarih = ''
+
+        for rr in range(header_row + 1, wsf.max_row + 1):
+            # Tamamen boş satırları atla (trailing empty rows)
+            row_has_data = any(
+                wsf.cell(row=rr, column=c).value
+                for c in range(1, min(wsf.max_column + 1, 12))
+            )
+            if not row_has_data:
+                continue
+            sonuc['son_veri_satiri'] = rr
+
+            musteri_val = safe_str(wsf.cell(row=rr, column=cols['musteri']).value)
+            if musteri_val:
+                # Yeni müşteri bloğu: carry-forward değerlerini sıfırla
+                if musteri_val != last_musteri:
+                    last_tarih = ''  # Tarih önceki müşteriden taşınmasın
+                last_musteri = musteri_val
+                last_yetkili = safe_str(wsf.cell(row=rr, column=cols.get('yetkili', 0)).value) if cols.get('yetkili') else ''
+                last_iletisim = safe_str(wsf.cell(row=rr, column=cols.get('iletisim', 0)).value) if cols.get('iletisim') else ''
+            else:
+                musteri_val = last_musteri
+
+            if not musteri_val:
+                continue
+
+            yetkili = safe_str(wsf.cell(row=rr, column=cols.get('yetkili', 0)).value) if cols.get('yetkili') else ''
+            if not yetkili:
+                yetkili = last_yetkili
+            iletisim = safe_str(wsf.cell(row=rr, column=cols.get('iletisim', 0)).value) if cols.get('iletisim') else ''
+            if not iletisim:
+                iletisim = last_iletisim
+
+            tarih_val = wsf.cell(row=rr, column=cols.get('tarih', 0)).value if cols.get('tarih') else None
+            tarih_str = safe_date(tarih_val)
+            if tarih_str:
+                last_tarih = tarih_str
+            else:
+                tarih_str = last_tarih
+
+            lokasyon = safe_str(wsf.cell(row=rr, column=cols.get('lokasyon', 0)).value) if cols.get('lokasyon') else ''
+            gun = safe_str(wsf.cell(row=rr, column=cols.get('gun', 0)).value) if cols.get('gun') else ''
+            sure = safe_str(wsf.cell(row=rr, column=cols.get('sure', 0)).value) if cols.get('sure') else ''
+            notlar = safe_str(wsf.cell(row=rr, column=cols.get('notlar', 0)).value) if cols.get('notlar') else ''
+            urun = safe_str(wsf.cell(row=rr, column=cols.get('urun', 0)).value) if cols.get('urun') else ''
+            adet_val = wsf.cell(row=rr, column=cols.get('adet', 0)).value if cols.get('adet') else None
+            fiyat_val = wsf.cell(row=rr, column=cols.get('fiyat', 0)).value if cols.get('fiyat') else None
+            adet = safe_str(adet_val)
+            fiyat = safe_str(fiyat_val)
+
+            # Müşteri master
+            cust_key = normalize_tr(musteri_val)
+            if cust_key:
+                musteri_ekle(customers, cust_key, musteri_val, yetkili, iletisim, lokasyon, rep, tarih_str)
+
+            # Veri tipine göre kaydet
+            if is_planlanan:
+                sonuc['planlanan'].append({'rep': rep, 'week': week, 'lokasyon': lokasyon, 'musteri': musteri_val,
+                                           'tarih': tarih_str, 'gun': gun, 'notlar': notlar, 'dosya': fn})
+            elif is_yapilan or is_siparis_file:
+                if is_yapilan:
+                    # Müşteri+tarih+dosya bazında dedup (aynı müşterinin ürün alt-satırları tek ziyaret)
+                    visit_key = (rep, normalize_tr(musteri_val), tarih_str, fn)
+                    if visit_key not in visits_seen:
+                        visits_seen.add(visit_key)
+                        sonuc['yapilan'].append({'rep': rep, 'week': week, 'lokasyon': lokasyon, 'musteri': musteri_val,
+                                                 'yetkili': yetkili, 'iletisim': iletisim, 'tarih': tarih_str,
+                                                 'gun': gun, 'sure': sure, 'notlar': notlar, 'dosya': fn})
+
+                if urun or (is_siparis_file and (fiyat or adet)):
+                    if not urun:
+                        urun = '(Detaysız)'
+                    sonuc['siparis'].append({'rep': rep, 'week': week, 'musteri': musteri_val, 'yetkili': yetkili,
+                                             'iletisim': iletisim, 'tarih': tarih_str, 'urun': urun,
+                                             'adet': adet, 'fiyat': fiyat, 'dosya': fn,
+                                             'adet_n': sayi_cevir(adet_val), 'fiyat_n': sayi_cevir(fiyat_val)})
+        return sonuc
+    finally:
+        wbf.close()
+
+
+# Kopyalaması sürmekte olan (yarım) xlsx dosyası açılırken alınan hatalar
+YARIM_DOSYA_HATALARI = (zipfile.BadZipFile, EOFError, zlib.error)
+
+
+def veri_topla(dizin, onbellek=None, atla=(), arsiv_haftalari=()):
+    """Klasörü tara, her dosyayı oku; algılanan hafta/temsilci ile birlikte dosya sonuçlarını döndür.
+
+    onbellek verilirse ({dosya_adı: {'iz': ..., 'sonuc': ...}}) izi değişmemiş
+    dosyalar yeniden okunmaz. 'atla' içindeki dosyalar (ör. kopyalaması süren)
+    ve yarım olduğu için okunamayan dosyalar için önbellekteki son sağlam sonuç
+    kullanılır; bu dosyalar dönüşteki 'yarim_dosyalar' listesinde bildirilir.
+    Dönüşteki 'degisen', önbelleğe göre değişen (okunan/silinen/okunamayan)
+    dosya sayısıdır. 'arsiv_haftalari' (arşivin 'haftalar' sözlüğü) içindeki
+    haftaların dosyaları okunmaz ve bu haftalar dönüşteki hafta listesinde yer
+    almaz; arşivlendikten sonra eklenen veya değişen dosyalar uyarıyla
+    'arsiv_disi' listesinde [(dosya, hafta, neden)] bildirilir. Dönüşteki 'izler'
+    ({dosya_adı: iz}), her dosya sonucunun okunduğu dosya izidir; 'olcumler'
+    ({dosya_adı: {'kaynak', 'sure'}}) dosyanın bu derlemede nereden alındığını
+    ve son okuma süresini (saniye) verir.
+    """
+    xlsx_files = dosya_listesi_al(dizin)
     if not xlsx_files:
         log.error("Hiç Excel dosyası bulunamadı!")
-        log.error(f"  Dizin: {DOSYA_DIZINI}")
-        return False
+        log.error(f"  Dizin: {dizin}")
+        return None
 
-    log.info(f"Taranan dizin: {DOSYA_DIZINI}")
+    log.info(f"Taranan dizin: {dizin}")
     log.info(f"Bulunan dosya: {len(xlsx_files)}")
 
     # Otomatik algılama
     HAFTALAR = hafta_algila(xlsx_files)
     TEMSILCILER = temsilci_algila(xlsx_files)
+    arsivde = [h for h in HAFTALAR if h[0] in arsiv_haftalari]
+    HAFTALAR = [h for h in HAFTALAR if h[0] not in arsiv_haftalari]
+    if arsivde:
+        log.info(f"Arşivdeki haftalar ({len(arsivde)}) okunmayacak: {arsivde[0][0]} - {arsivde[-1][0]}")
 
     log.info(f"Algılanan haftalar ({len(HAFTALAR)}):")
     for label, ws, we, _, _ in HAFTALAR:
@@ -312,188 +615,608 @@ def master_data_olustur():
     for t in TEMSILCILER:
         log.info(f"  - {t}")
 
-    DOSYA_TIPLERI = ['Planlanan Ziyaret', 'Yapılan Ziyaret', 'Sipariş Formu']
-
-    # Veri toplama yapıları
-    all_planlanan = []
-    all_yapilan = []
-    all_siparis = []
-    customers = {}
-    file_status = {}
-    issues = []
-    visits_seen = set()
-
+    if onbellek is None:
+        onbellek = {}
+    degisen = 0
+    for fn in set(onbellek) - set(xlsx_files):
+        del onbellek[fn]
+        degisen += 1
+
+    sonuclar = []
+    izler = {}
+    olcumler = {}
+    arsiv_disi = []
+    yarim_dosyalar = []
+    okunan = 0
     log.info("Dosyalar okunuyor...")
     for fn in xlsx_files:
-        try:
-            wbf = openpyxl.load_workbook(DOSYA_DIZINI / fn, data_only=True)
-            wsf = wbf.active
-            fn_norm = normalize_tr(fn)
-            rep = temsilci_bul(fn, TEMSILCILER)
-            week = hafta_bul(fn, HAFTALAR)
-
-            if not rep or not week:
-                log.warning(f"  ATLA: {fn} (temsilci={rep or '?'}, hafta={week or '?'})")
-                wbf.close()
-                continue
+        rep = temsilci_bul(fn, TEMSILCILER)
+        arsiv_haftasi = hafta_bul(fn, arsivde) if arsivde else None
+        if arsiv_haftasi:
+            onbellek.pop(fn, None)  # Arşivlenmiş hafta: kaynak dosya artık okunmaz
+            kayit = arsiv_haftalari[arsiv_haftasi]
+            neden = None
+            if fn not in kayit.get('dosyalar', ()):
+                neden = 'arşivlendikten sonra eklendi'
+            elif fn in kayit.get('izler', {}):
+                try:
+                    if tuple(kayit['izler'][fn]) != dosya_izi(dizin / fn):
+                        neden = 'arşivlendikten sonra değişti'
+                except FileNotFoundError:
+                    pass
+            if neden:
+                arsiv_disi.append((fn, arsiv_haftasi, neden))
+                log.warning(f"  ARŞİV: {fn} - {arsiv_haftasi} haftası arşivde, dosya {neden}; verisi rapora girmez")
+            continue
+        week = hafta_bul(fn, HAFTALAR)
+        if not rep or not week:
+            log.warning(f"  ATLA: {fn} (temsilci={rep or '?'}, hafta={week or '?'})")
+            olcumler[fn] = {'kaynak': 'atlandi', 'sure': None}
+            if onbellek.pop(fn, None):
+                degisen += 1
+            continue
 
-            ftype = dosya_tipi_bul(fn)
-            is_planlanan = ftype == 'Planlanan Ziyaret'
-            is_yapilan = ftype == 'Yapılan Ziyaret'
-            is_siparis_file = ftype == 'Sipariş Formu'
-
-            # Header satırı ve gömülü sipariş kontrolü
-            has_embedded_siparis = False
-            header_row = None
-
-            for hr in range(1, 6):
-                vals = ' '.join([safe_str(wsf.cell(row=hr, column=c).value) for c in range(1, wsf.max_column + 1)])
-                vn = normalize_tr(vals)
-                if 'URUN' in vn and ('FIYAT' in vn or 'ADET' in vn):
-                    has_embedded_siparis = True
-                    header_row = hr
-                    break
-                if ('LOKASYON' in vn or 'MUSTERI' in vn or 'GORUSULEN' in vn) and header_row is None:
-                    header_row = hr
-
-            if header_row is None:
-                header_row = 3 if wsf.max_row > 3 else 1
-
-            # Kolon eşleştirme
-            cols = {}
-            for c in range(1, wsf.max_column + 1):
-                v = safe_str(wsf.cell(row=header_row, column=c).value)
-                vn = normalize_tr(v)
-                if ('MUSTERI' in vn or 'GORUSULEN' in vn or 'FIRMA' in vn) and 'musteri' not in cols:
-                    cols['musteri'] = c
-                elif ('YETKILI' in vn or 'KISI ADI' in vn) and 'yetkili' not in cols:
-                    cols['yetkili'] = c
-                elif ('ILETISIM' in vn or 'NUMARA' in vn or 'TELEFON' in vn) and 'iletisim' not in cols:
-                    cols['iletisim'] = c
-                elif ('LOKASYON' in vn or vn.strip() in ('IL', 'IL)')) and 'lokasyon' not in cols:
-                    cols['lokasyon'] = c
-                elif 'TARIH' in vn and 'GORUSME' not in vn and 'tarih' not in cols:
-                    cols['tarih'] = c
-                elif 'GUN' in vn and 'gun' not in cols:
-                    cols['gun'] = c
-                elif 'SURE' in vn and 'sure' not in cols:
-                    cols['sure'] = c
-                elif 'URUN' in vn and 'urun' not in cols:
-                    cols['urun'] = c
-                elif 'ADET' in vn and 'adet' not in cols:
-                    cols['adet'] = c
-                elif 'FIYAT' in vn and 'fiyat' not in cols:
-                    cols['fiyat'] = c
-                elif 'NOT' in vn and 'NUMARA' not in vn and 'notlar' not in cols:
-                    cols['notlar'] = c
-
-            # Dosya durumu kaydet
-            if is_planlanan:
-                file_status[(rep, week, 'Planlanan Ziyaret')] = fn
-            if is_yapilan:
-                file_status[(rep, week, 'Yapılan Ziyaret')] = fn
-            if is_siparis_file:
-                file_status[(rep, week, 'Sipariş Formu')] = fn
-            if has_embedded_siparis and is_yapilan:
-                file_status[(rep, week, 'Sipariş Formu')] = fn + ' (gömülü)'
-
-            # Veri satırlarını oku
-            if 'musteri' not in cols:
-                log.warning(f"  UYARI: {fn} - 'Müşteri' kolonu bulunamadı, atlanıyor")
-                wbf.close()
-                continue
+        eski = onbellek.get(fn)
+        if eski and (eski['sonuc']['rep'] != rep or eski['sonuc']['week'] != week):
+            eski = None  # Algılanan temsilci/hafta değişti, eski sonuç geçersiz
+        if fn in atla:
+            yarim_dosyalar.append(fn)
+            olcumler[fn] = {'kaynak': 'bekliyor', 'sure': eski.get('sure') if eski else None}
+            if eski:
+                sonuclar.append(eski['sonuc'])
+                izler[fn] = eski['iz']
+            log.info(f"  BEKLİYOR: {fn} (kopyalama sürüyor)")
+            continue
 
-            last_musteri = last_yetkili = last_iletisim = last_tarih = ''
-
-            for rr in range(header_row + 1, wsf.max_row + 1):
-                # Tamamen boş satırları atla (trailing empty rows)
-                row_has_data = any(
-                    wsf.cell(row=rr, column=c).value
-                    for c in range(1, min(wsf.max_column + 1, 12))
-                )
-                if not row_has_data:
-                    continue
-
-                musteri_val = safe_str(wsf.cell(row=rr, column=cols['musteri']).value)
-                if musteri_val:
-                    # Yeni müşteri bloğu: carry-forward değerlerini sıfırla
-                    if musteri_val != last_musteri:
-                        last_tarih = ''  # Tarih önceki müşteriden taşınmasın
-                    last_musteri = musteri_val
-                    last_yetkili = safe_str(wsf.cell(row=rr, column=cols.get('yetkili', 0)).value) if cols.get('yetkili') else ''
-                    last_iletisim = safe_str(wsf.cell(row=rr, column=cols.get('iletisim', 0)).value) if cols.get('iletisim') else ''
-                else:
-                    musteri_val = last_musteri
-
-                if not musteri_val:
-                    continue
-
-                yetkili = safe_str(wsf.cell(row=rr, column=cols.get('yetkili', 0)).value) if cols.get('yetkili') else ''
-                if not yetkili:
-                    yetkili = last_yetkili
-                iletisim = safe_str(wsf.cell(row=rr, column=cols.get('iletisim', 0)).value) if cols.get('iletisim') else ''
-                if not iletisim:
-                    iletisim = last_iletisim
-
-                tarih_val = wsf.cell(row=rr, column=cols.get('tarih', 0)).value if cols.get('tarih') else None
-                tarih_str = safe_date(tarih_val)
-                if tarih_str:
-                    last_tarih = tarih_str
-                else:
-                    tarih_str = last_tarih
-
-                lokasyon = safe_str(wsf.cell(row=rr, column=cols.get('lokasyon', 0)).value) if cols.get('lokasyon') else ''
-                gun = safe_str(wsf.cell(row=rr, column=cols.get('gun', 0)).value) if cols.get('gun') else ''
-                sure = safe_str(wsf.cell(row=rr, column=cols.get('sure', 0)).value) if cols.get('sure') else ''
-                notlar = safe_str(wsf.cell(row=rr, column=cols.get('notlar', 0)).value) if cols.get('notlar') else ''
-                urun = safe_str(wsf.cell(row=rr, column=cols.get('urun', 0)).value) if cols.get('urun') else ''
-                adet = safe_str(wsf.cell(row=rr, column=cols.get('adet', 0)).value) if cols.get('adet') else ''
-                fiyat = safe_str(wsf.cell(row=rr, column=cols.get('fiyat', 0)).value) if cols.get('fiyat') else ''
-
-                # Müşteri master
-                cust_key = normalize_tr(musteri_val)
-                if cust_key and cust_key not in customers:
-                    customers[cust_key] = {'name': musteri_val, 'yetkili': yetkili, 'iletisim': iletisim,
-                                           'lokasyon': lokasyon, 'rep': rep, 'tarih': tarih_str}
-                elif cust_key:
-                    if yetkili and not customers[cust_key]['yetkili']:
-                        customers[cust_key]['yetkili'] = yetkili
-                    if iletisim and not customers[cust_key]['iletisim']:
-                        customers[cust_key]['iletisim'] = iletisim
-                    if tarih_str:
-                        customers[cust_key]['tarih'] = tarih_str
-
-                # Veri tipine göre kaydet
-                if is_planlanan:
-                    all_planlanan.append({'rep': rep, 'week': week, 'lokasyon': lokasyon, 'musteri': musteri_val,
-                                          'tarih': tarih_str, 'gun': gun, 'notlar': notlar, 'dosya': fn})
-                elif is_yapilan or is_siparis_file:
-                    if is_yapilan:
-                        # Müşteri+tarih+dosya bazında dedup (aynı müşterinin ürün alt-satırları tek ziyaret)
-                        visit_key = (rep, normalize_tr(musteri_val), tarih_str, fn)
-                        if visit_key not in visits_seen:
-                            visits_seen.add(visit_key)
-                            all_yapilan.append({'rep': rep, 'week': week, 'lokasyon': lokasyon, 'musteri': musteri_val,
-                                                'yetkili': yetkili, 'iletisim': iletisim, 'tarih': tarih_str,
-                                                'gun': gun, 'sure': sure, 'notlar': notlar, 'dosya': fn})
-
-                    if urun or (is_siparis_file and (fiyat or adet)):
-                        if not urun:
-                            urun = '(Detaysız)'
-                        all_siparis.append({'rep': rep, 'week': week, 'musteri': musteri_val, 'yetkili': yetkili,
-                                            'iletisim': iletisim, 'tarih': tarih_str, 'urun': urun,
-                                            'adet': adet, 'fiyat': fiyat, 'dosya': fn})
-
-            wbf.close()
+        try:
+            iz = dosya_izi(dizin / fn)
+            if eski and eski['iz'] == iz:
+                sonuclar.append(eski['sonuc'])
+                izler[fn] = iz
+                olcumler[fn] = {'kaynak': 'onbellek', 'sure': eski.get('sure')}
+                continue
+            t0 = time.perf_counter()
+            sonuc = dosya_oku(dizin, fn, rep, week)
+            sure = time.perf_counter() - t0
+            onbellek[fn] = {'iz': iz, 'sonuc': sonuc, 'sure': sure}
+            sonuclar.append(sonuc)
+            izler[fn] = iz
+            olcumler[fn] = {'kaynak': 'okundu', 'sure': sure}
+            okunan += 1
             log.info(f"  OK: {fn}")
+        except YARIM_DOSYA_HATALARI as e:
+            yarim_dosyalar.append(fn)
+            olcumler[fn] = {'kaynak': 'yarim', 'sure': eski.get('sure') if eski else None}
+            if eski:
+                sonuclar.append(eski['sonuc'])
+                izler[fn] = eski['iz']
+            log.warning(f"  YARIM: {fn} - {e} (sonra tekrar denenecek)")
         except Exception as e:
+            onbellek.pop(fn, None)
+            degisen += 1
+            olcumler[fn] = {'kaynak': 'hata', 'sure': None}
             log.error(f"  HATA: {fn} - {e}")
 
-    log.info(f"Toplam: {len(all_planlanan)} planlanan, {len(all_yapilan)} yapılan, {len(all_siparis)} sipariş, {len(customers)} müşteri")
+    if okunan < len(sonuclar):
+        log.info(f"  {len(sonuclar) - okunan} dosya önbellekten alındı, {okunan} dosya okundu")
+
+    return {'dizin': str(dizin), 'dosya_sayisi': len(xlsx_files), 'dosyalar': xlsx_files, 'haftalar': HAFTALAR,
+            'temsilciler': TEMSILCILER, 'sonuclar': sonuclar, 'izler': izler, 'olcumler': olcumler,
+            'arsiv_disi': arsiv_disi,
+            'yarim_dosyalar': yarim_dosyalar,
+            'degisen': degisen + okunan + len(yarim_dosyalar)}
+
+
+def sonuclari_birlestir(sonuclar):
+    """Dosya sonuçlarını sırayla katlayarak tek veri kümesi oluştur."""
+    durum = {'planlanan': [], 'yapilan': [], 'siparis': [], 'musteriler': {}, 'dosya_durumu': {},
+             'musteri_gecmisi': {}}
+    file_status = durum['dosya_durumu']
+    gecmis = durum['musteri_gecmisi']
+    visits_seen = set()
+
+    for s in sonuclar:
+        rep, week, fn = s['rep'], s['week'], s['dosya']
+        # Dosya durumu kaydet
+        if s['tip'] in DOSYA_TIPLERI:
+            file_status[(rep, week, s['tip'])] = fn
+        if s['gomulu'] and s['tip'] == 'Yapılan Ziyaret':
+            file_status[(rep, week, 'Sipariş Formu')] = fn + ' (gömülü)'
+
+        durum['planlanan'].extend(s['planlanan'])
+        for rec in s['planlanan']:
+            gecmise_ekle(gecmis, 'plan', rec)
+        for rec in s['yapilan']:
+            visit_key = (rec['rep'], normalize_tr(rec['musteri']), rec['tarih'], rec['dosya'])
+            if visit_key not in visits_seen:
+                visits_seen.add(visit_key)
+                durum['yapilan'].append(rec)
+                gecmise_ekle(gecmis, 'ziyaret', rec)
+        durum['siparis'].extend(s['siparis'])
+        for rec in s['siparis']:
+            gecmise_ekle(gecmis, 'siparis', rec)
+        musterileri_birlestir(durum['musteriler'], s['musteriler'])
+
+    for g in gecmis.values():
+        for tur in ('plan', 'ziyaret', 'siparis'):
+            for liste in g[tur].values():
+                liste.sort()
+
+    log.info(f"Toplam: {len(durum['planlanan'])} planlanan, {len(durum['yapilan'])} yapılan, "
+             f"{len(durum['siparis'])} sipariş, {len(durum['musteriler'])} müşteri")
+    return durum
+
+
+def temsilci_hafta_ozeti(durum):
+    """Kayıtları tek geçişte temsilci x hafta bazında say.
+
+    Dönüş: {(temsilci, hafta): {'planlanan', 'yapilan', 'siparis', 'musteri', 'tutar'}}
+    ('musteri': yapılan ziyaret veya siparişteki benzersiz müşteri sayısı).
+    """
+    ozet = {}
+    musteri_kumeleri = defaultdict(set)
+
+    def sayac(rec):
+        key = (rec['rep'], rec['week'])
+        if key not in ozet:
+            ozet[key] = {'planlanan': 0, 'yapilan': 0, 'siparis': 0, 'musteri': 0, 'tutar': 0.0}
+        return ozet[key]
+
+    for rec in durum['planlanan']:
+        sayac(rec)['planlanan'] += 1
+    for rec in durum['yapilan']:
+        sayac(rec)['yapilan'] += 1
+        if rec['musteri']:
+            musteri_kumeleri[(rec['rep'], rec['week'])].add(normalize_tr(rec['musteri']))
+    for rec in durum['siparis']:
+        o = sayac(rec)
+        o['siparis'] += 1
+        o['tutar'] += siparis_tutari(rec.get('adet_n'), rec.get('fiyat_n')) or 0.0
+        if rec['musteri']:
+            musteri_kumeleri[(rec['rep'], rec['week'])].add(normalize_tr(rec['musteri']))
+    for key, kume in musteri_kumeleri.items():
+        ozet[key]['musteri'] = len(kume)
+    return ozet
+
+
+# ============================================================
+# MÜŞTERİ GEÇMİŞİ
+# ============================================================
+# musteri_gecmisi: {müşteri_anahtarı: {'plan'|'ziyaret'|'siparis': {temsilci: [(gün, hafta), ...]}}}
+# Gün, tarihin ordinal değeridir; listeler birleştirme sonunda sıralanır.
+
+def gecmise_ekle(gecmis, tur, rec):
+    """Kaydın tarihini müşteri geçmiş indeksine ekle (tarihsiz kayıtlar atlanır)."""
+    dt = tarih_cevir(rec['tarih'])
+    cust_key = normalize_tr(rec['musteri'])
+    if dt is None or not cust_key:
+        return
+    g = gecmis.get(cust_key)
+    if g is None:
+        g = gecmis[cust_key] = {'plan': {}, 'ziyaret': {}, 'siparis': {}}
+    g[tur].setdefault(rec['rep'], []).append((dt.toordinal(), rec['week']))
+
+
+def gecmis_ozeti(gecmis):
+    """Geçmiş indeksini müşteri başına birleştirilebilir özet sayılara indir.
+
+    Planlanıp ziyaret edilmeyen: temsilcinin o hafta müşteriyi hiç ziyaret
+    etmediği planlı günlerin sayısı.
+    """
+    ozet = {}
+    for cust_key, g in gecmis.items():
+        ziyaret_sayisi = 0
+        ziyaret_gunleri = set()
+        for liste in g['ziyaret'].values():
+            gunler = {gun for gun, _ in liste}
+            ziyaret_sayisi += len(gunler)
+            ziyaret_gunleri |= gunler
+
+        plan_edilmeyen = 0
+        for rep, liste in g['plan'].items():
+            ziyaret_haftalari = {w for _, w in g['ziyaret'].get(rep, ())}
+            plan_edilmeyen += len({gun for gun, w in liste if w not in ziyaret_haftalari})
+
+        ozet[cust_key] = {
+            'ziyaret_sayisi': ziyaret_sayisi,
+            'gun_sayisi': len(ziyaret_gunleri),
+            'ilk_ziyaret': min(ziyaret_gunleri, default=None),
+            'son_ziyaret': max(ziyaret_gunleri, default=None),
+            'plan_edilmeyen': plan_edilmeyen,
+            'son_siparis': max((liste[-1][0] for liste in g['siparis'].values()), default=None),
+        }
+    return ozet
+
+
+def ozetleri_birlestir(hedef, kaynak):
+    """Müşteri geçmiş özetlerini (farklı haftalara ait) hedefte birleştir."""
+    for cust_key, o in kaynak.items():
+        h = hedef.get(cust_key)
+        if h is None:
+            hedef[cust_key] = dict(o)
+            continue
+        h['ziyaret_sayisi'] += o['ziyaret_sayisi']
+        h['gun_sayisi'] += o['gun_sayisi']
+        h['plan_edilmeyen'] += o['plan_edilmeyen']
+        for alan, fn in (('ilk_ziyaret', min), ('son_ziyaret', max), ('son_siparis', max)):
+            degerler = [v for v in (h[alan], o[alan]) if v is not None]
+            h[alan] = fn(degerler) if degerler else None
+    return hedef
+
+
+def musteri_metrikleri(gecmis, bugun, arsiv_ozeti=None):
+    """Her müşteri için ziyaret sıklığı ve yakınlık metriklerini tek geçişte hesapla.
+
+    arsiv_ozeti verilirse arşivlenmiş haftaların müşteri özetleri de dahil edilir.
+    """
+    ozet = gecmis_ozeti(gecmis)
+    if arsiv_ozeti:
+        ozet = ozetleri_birlestir({k: dict(v) for k, v in arsiv_ozeti.items()}, ozet)
+
+    bugun_g = bugun.toordinal()
+    metrikler = {}
+    for cust_key, o in ozet.items():
+        son_ziyaret, son_siparis = o['son_ziyaret'], o['son_siparis']
+        metrikler[cust_key] = {
+            'son_ziyaret': son_ziyaret,
+            'ziyaret_sayisi': o['ziyaret_sayisi'],
+            'ort_aralik': (son_ziyaret - o['ilk_ziyaret']) / (o['gun_sayisi'] - 1) if o['gun_sayisi'] > 1 else None,
+            'plan_edilmeyen': o['plan_edilmeyen'],
+            'son_siparis': son_siparis,
+            'ziyaretten_beri': bugun_g - son_ziyaret if son_ziyaret is not None else None,
+            'siparisten_beri': bugun_g - son_siparis if son_siparis is not None else None,
+        }
+    return metrikler
+
+
+def geciken_musteriler(metrikler):
+    """Beklenen ziyaret aralığını aşmış veya planlandığı halde hiç ziyaret edilmemiş müşteriler.
+
+    Dönüş: [(müşteri_anahtarı, beklenen_aralık, gecikme_gün)], gecikmesi büyük olan önce;
+    hiç ziyaret edilmemişlerde gecikme None'dır ve listenin sonunda yer alır.
+    """
+    geciken = []
+    for cust_key, m in metrikler.items():
+        esik = m['ort_aralik'] * GECIKME_KATSAYI if m['ort_aralik'] else GECIKME_GUN
+        if m['son_ziyaret'] is None:
+            if m['plan_edilmeyen']:
+                geciken.append((cust_key, esik, None))
+        elif m['ziyaretten_beri'] > esik:
+            geciken.append((cust_key, esik, m['ziyaretten_beri'] - esik))
+    geciken.sort(key=lambda x: (x[2] is None, -(x[2] or 0), x[0]))
+    return geciken
+
+
+def gun_metni(gun):
+    """Ordinal günü 'GG.AA.YYYY' olarak yaz; None ise boş metin."""
+    return datetime.fromordinal(gun).strftime('%d.%m.%Y') if gun is not None else ''
+
+
+# ============================================================
+# SİPARİŞ ANALİZİ
+# ============================================================
+
+def siparis_tutari(adet_n, fiyat_n):
+    """Sipariş satırı tutarı: fiyat birim fiyat kabul edilir, adet yoksa 1 sayılır."""
+    if fiyat_n is None:
+        return None
+    return fiyat_n * (adet_n if adet_n is not None else 1)
+
+
+def siparis_analizi(siparisler, haftalar):
+    """Siparişleri temsilci x hafta x ürün ve müşteri bazında tek geçişte topla.
+
+    Anahtarlar bir kez tamsayı koda çevrilir; toplama NumPy varsa bincount ile
+    vektörel, yoksa aynı kodlar üzerinde düz döngüyle yapılır.
+    Dönüş: ([(temsilci, hafta, ürün, satır, adet, tutar)], [(müşteri, satır, adet, tutar)])
+    """
+    hafta_sira = {label: i for i, (label, _, _, _, _) in enumerate(haftalar)}
+    rep_kod, week_kod, urun_kod, mus_kod = {}, {}, {}, {}
+    urun_ad, mus_ad = [], []
+    r_k, w_k, u_k, m_k, adetler, tutarlar = [], [], [], [], [], []
+
+    for rec in siparisler:
+        r_k.append(rep_kod.setdefault(rec['rep'], len(rep_kod)))
+        w_k.append(week_kod.setdefault(rec['week'], len(week_kod)))
+        uk = normalize_tr(rec['urun'])
+        if uk not in urun_kod:
+            urun_kod[uk] = len(urun_kod)
+            urun_ad.append(rec['urun'])
+        u_k.append(urun_kod[uk])
+        mk = normalize_tr(rec['musteri'])
+        if mk not in mus_kod:
+            mus_kod[mk] = len(mus_kod)
+            mus_ad.append(rec['musteri'])
+        m_k.append(mus_kod[mk])
+        adet_n = rec.get('adet_n')
+        tutar = siparis_tutari(adet_n, rec.get('fiyat_n'))
+        adetler.append(adet_n or 0.0)
+        tutarlar.append(tutar or 0.0)
+
+    n_w, n_u = max(len(week_kod), 1), max(len(urun_kod), 1)
+    if np is not None and siparisler:
+        grup = (np.array(r_k, dtype=np.int64) * n_w + np.array(w_k, dtype=np.int64)) * n_u + np.array(u_k, dtype=np.int64)
+        adet_arr = np.array(adetler, dtype=np.float64)
+        tutar_arr = np.array(tutarlar, dtype=np.float64)
+
+        anahtar, ters = np.unique(grup, return_inverse=True)
+        g_satir = np.bincount(ters)
+        g_adet = np.bincount(ters, weights=adet_arr)
+        g_tutar = np.bincount(ters, weights=tutar_arr)
+        grup_toplam = {int(k): (int(s), float(a), float(t))
+                       for k, s, a, t in zip(anahtar, g_satir, g_adet, g_tutar)}
+
+        m_arr = np.array(m_k, dtype=np.int64)
+        m_satir = np.bincount(m_arr, minlength=len(mus_kod))
+        m_adet = np.bincount(m_arr, weights=adet_arr, minlength=len(mus_kod))
+        m_tutar = np.bincount(m_arr, weights=tutar_arr, minlength=len(mus_kod))
+        mus_toplam = [(int(s), float(a), float(t)) for s, a, t in zip(m_satir, m_adet, m_tutar)]
+    else:
+        grup_toplam = {}
+        mus_toplam = [[0, 0.0, 0.0] for _ in mus_kod]
+        for r, w, u, m, a, t in zip(r_k, w_k, u_k, m_k, adetler, tutarlar):
+            k = (r * n_w + w) * n_u + u
+            s0, a0, t0 = grup_toplam.get(k, (0, 0.0, 0.0))
+            grup_toplam[k] = (s0 + 1, a0 + a, t0 + t)
+            mt = mus_toplam[m]
+            mt[0] += 1
+            mt[1] += a
+            mt[2] += t
+
+    rep_ad = {v: k for k, v in rep_kod.items()}
+    week_ad = {v: k for k, v in week_kod.items()}
+    urun_satirlari = []
+    for k, (satir, adet, tutar) in grup_toplam.items():
+        r, rest = divmod(k, n_w * n_u)
+        w, u = divmod(rest, n_u)
+        urun_satirlari.append((rep_ad[r], week_ad[w], urun_ad[u], satir, adet, tutar))
+    urun_satirlari.sort(key=lambda x: (x[0], hafta_sira.get(x[1], len(hafta_sira)), -x[5], normalize_tr(x[2])))
+
+    musteri_satirlari = [(mus_ad[i], s, a, t) for i, (s, a, t) in enumerate(mus_toplam)]
+    musteri_satirlari.sort(key=lambda x: (-x[3], normalize_tr(x[0])))
+    return urun_satirlari, musteri_satirlari
+
+
+# ============================================================
+# VERİ KALİTE KURALLARI
+# ============================================================
+# Her kural @kalite_kurali ile kaydedilir ve kapsamını bildirir:
+#   'dosya'          -> kural(sonuc, hafta): tek dosyanın okunmuş sonucu
+#   'kayit'          -> kural(tur, rec, hafta): dosyadaki her kayıt (planlanan/yapilan/siparis)
+#   'temsilci_hafta' -> kural(rep, hafta, dosyalar): temsilcinin o haftaki tüm dosya sonuçları
+#   'arsiv'          -> kural(dosya, hafta_etiketi, neden): arşivlenmiş haftaya sonradan
+#                       eklenen/değişen dosya (okunmadığı için önbelleğe alınmaz)
+# Kural (anahtar, açıklama, dosya, çözüm) demetleri üretir. Sorun kimliği kural
+# kodu ile anahtardan türetilir; aynı sorun her derlemede aynı kimliği alır ve
+# tekilleştirme bu kimlikle yapılır. Sonuçlar girdi izine göre önbelleklenir:
+# yalnızca değişen dosyaların ve o dosyaların temsilci-haftalarının kuralları
+# yeniden çalışır.
+
+KALITE_KURALLARI = []
+ONCELIK_SIRASI = {'KRİTİK': 0, 'YÜKSEK': 1, 'ORTA': 2}
+
+
+def kalite_kurali(kod, kapsam, oncelik, kategori):
+    """Veri kalite kuralını kayıt defterine ekleyen dekoratör."""
+    def kaydet(fn):
+        KALITE_KURALLARI.append({'kod': kod, 'kapsam': kapsam, 'oncelik': oncelik,
+                                 'kategori': kategori, 'fn': fn})
+        return fn
+    return kaydet
+
+
+def kararli_kimlik(kod, anahtar):
+    """Kod ve anahtardan derlemeler arasında değişmeyen kimlik üret (ör. TARIH-3f2a9c01be)."""
+    return f"{kod}-{hashlib.sha1(repr(anahtar).encode('utf-8')).hexdigest()[:10]}"
+
+
+def kural_uygula(kural, args, sorunlar):
+    """Kuralı çalıştır, ürettiği sorunları kimlikleriyle listeye ekle."""
+    for anahtar, aciklama, dosya, cozum in kural['fn'](*args):
+        sorunlar.append((kararli_kimlik(kural['kod'], anahtar), kural['oncelik'], kural['kategori'],
+                         aciklama, dosya, cozum))
+
+
+@kalite_kurali('EKSIK', 'temsilci_hafta', 'KRİTİK', 'Eksik Dosya')
+def eksik_dosya_kurali(rep, hafta, dosyalar):
+    """Temsilci-haftada bulunmayan dosya tipleri."""
+    tipler = {s['tip'] for s in dosyalar}
+    if any(s['gomulu'] and s['tip'] == 'Yapılan Ziyaret' for s in dosyalar):
+        tipler.add('Sipariş Formu')
+    for ftype in DOSYA_TIPLERI:
+        if ftype not in tipler:
+            yield ((rep, hafta[0], ftype), f'{rep} - {hafta[0]} {ftype} dosyası eksik', '',
+                   'Ekipten iste veya manuel gir')
+
+
+@kalite_kurali('TARIH', 'kayit', 'YÜKSEK', 'Tarih Hatası')
+def tarih_araligi_kurali(tur, rec, hafta):
+    """Ziyaret/plan tarihi dosyanın haftası dışında."""
+    if tur == 'siparis' or not rec['tarih']:
+        return
+    rec_dt = tarih_cevir(rec['tarih'])
+    if rec_dt and (rec_dt < hafta[3] or rec_dt > hafta[4]):
+        yield ((rec['dosya'], rec['tarih']), f'{rec["rep"]}: {rec["tarih"]} tarihi {hafta[0]} aralığı dışında',
+               rec['dosya'], 'Tarihi kontrol et')
+
+
+@kalite_kurali('MUKERRER', 'temsilci_hafta', 'YÜKSEK', 'Mükerrer Ziyaret')
+def mukerrer_ziyaret_kurali(rep, hafta, dosyalar):
+    """Aynı müşteri+tarih ziyareti birden fazla dosyada."""
+    # Dosya içi tekrarlar okumada tekilleşir; aynı ziyaret birden fazla dosyadaysa iki kez sayılır
+    ziyaretler = {}
+    for s in dosyalar:
+        for rec in s['yapilan']:
+            ziyaretler.setdefault((normalize_tr(rec['musteri']), rec['tarih']), []).append(rec)
+    for (cust_key, tarih), recs in ziyaretler.items():
+        dosya_adlari = sorted({r['dosya'] for r in recs})
+        if len(dosya_adlari) > 1:
+            yield ((rep, cust_key, tarih),
+                   f'{rep}: {recs[0]["musteri"]} {tarih or "(tarihsiz)"} ziyareti {len(dosya_adlari)} dosyada var',
+                   ', '.join(dosya_adlari), 'Fazla dosyayı kaldır veya kaydı birinden sil')
+
+
+@kalite_kurali('PLAN', 'temsilci_hafta', 'ORTA', 'Ziyaretsiz Plan')
+def ziyaretsiz_plan_kurali(rep, hafta, dosyalar):
+    """Planlanan müşteriye o hafta ziyaret kaydı yok."""
+    if not any(s['tip'] == 'Yapılan Ziyaret' for s in dosyalar):
+        return  # Yapılan ziyaret dosyası yoksa EKSIK kuralı raporlar
+    ziyaret_edilen = {normalize_tr(r['musteri']) for s in dosyalar for r in s['yapilan']}
+    gorulen = set()
+    for s in dosyalar:
+        for rec in s['planlanan']:
+            cust_key = normalize_tr(rec['musteri'])
+            if cust_key and cust_key not in ziyaret_edilen and cust_key not in gorulen:
+                gorulen.add(cust_key)
+                yield ((rep, hafta[0], cust_key),
+                       f'{rep}: {rec["musteri"]} {hafta[0]} için planlandı, ziyaret kaydı yok',
+                       rec['dosya'], 'Ziyaret yapıldıysa Yapılan Ziyaret dosyasına ekle')
+
+
+@kalite_kurali('SIPARIS', 'temsilci_hafta', 'ORTA', 'Ziyaretsiz Sipariş')
+def ziyaretsiz_siparis_kurali(rep, hafta, dosyalar):
+    """Sipariş formundaki müşteriye o hafta ziyaret kaydı yok."""
+    # Gömülü siparişler zaten ziyaret satırından gelir; yalnızca ayrı sipariş formları kontrol edilir
+    if not any(s['tip'] == 'Yapılan Ziyaret' for s in dosyalar):
+        return
+    ziyaret_edilen = {normalize_tr(r['musteri']) for s in dosyalar for r in s['yapilan']}
+    gorulen = set()
+    for s in dosyalar:
+        if s['tip'] != 'Sipariş Formu':
+            continue
+        for rec in s['siparis']:
+            cust_key = normalize_tr(rec['musteri'])
+            if cust_key and cust_key not in ziyaret_edilen and cust_key not in gorulen:
+                gorulen.add(cust_key)
+                yield ((rep, hafta[0], cust_key),
+                       f'{rep}: {rec["musteri"]} siparişi var, {hafta[0]} ziyaret kaydı yok',
+                       rec['dosya'], 'Ziyareti Yapılan Ziyaret dosyasına ekle veya siparişi kontrol et')
+
+
+@kalite_kurali('ARALIK', 'dosya', 'ORTA', 'Şişik Sayfa Aralığı')
+def sisik_aralik_kurali(s, hafta):
+    """Sayfa aralığı son veri satırından çok ileri uzanıyor."""
+    # Biçimlendirme boş satırlara taşınınca max_row büyür; her derlemede bu satırlar da taranır
+    son = s.get('son_veri_satiri')
+    if son is None:
+        return  # Eski parça/durum kaydı veya okunamayan sayfa
+    bos = s.get('satir_sayisi', 0) - son
+    if bos >= SISIK_ARALIK_SATIR:
+        yield ((s['dosya'],), f'Sayfa {s["satir_sayisi"]} satır, veri {son}. satırda bitiyor ({bos} boş satır)',
+               s['dosya'], 'Veriden sonraki boş satırları silip kaydet')
+
+
+@kalite_kurali('ARSIV', 'arsiv', 'YÜKSEK', 'Arşivlenmiş Hafta')
+def arsiv_disi_dosya_kurali(fn, etiket, neden):
+    """Arşivlenmiş haftaya ait dosya arşivden sonra eklenmiş veya değişmiş."""
+    yield ((fn, neden), f'{etiket} haftası arşivde, dosya {neden}; verisi rapora girmedi', fn,
+           f'{ARSIV_DOSYA} dosyasını silip yeniden çalıştır')
+
+
+def kalite_kontrol(sonuclar, haftalar, temsilciler, izler=None, onbellek=None, arsiv_disi=()):
+    """Tüm kalite kurallarını tek geçişte çalıştır, kimliğe göre tekil sorun listesini döndür.
+
+    izler ({dosya_adı: iz}) ve onbellek verilirse girdisi değişmemiş dosyaların ve
+    temsilci-haftaların sonuçları önbellekten alınır; onbellek yerinde güncellenir.
+    Sorun: (kimlik, öncelik, kategori, açıklama, dosya, çözüm).
+    """
+    izler = izler or {}
+    if onbellek is None:
+        onbellek = {}
+    kurallar = defaultdict(list)
+    for kural in KALITE_KURALLARI:
+        kurallar[kural['kapsam']].append(kural)
+    hafta_map = {h[0]: h for h in haftalar}
+    eski_dosya = onbellek.get('dosya', {})
+    eski_th = onbellek.get('temsilci_hafta', {})
+    yeni_dosya, yeni_th = {}, {}
+
+    # Dosya ve kayıt kapsamlı kurallar: dosya başına tek geçiş
+    dosya_sorunlari = []
+    gruplar = defaultdict(list)
+    yeniden = 0
+    for s in sonuclar:
+        hafta = hafta_map.get(s['week'])
+        if hafta is None:
+            continue
+        gruplar[(s['rep'], s['week'])].append(s)
+        iz = izler.get(s['dosya'])
+        anahtar = (iz, s['rep'], hafta[:3])
+        eski = eski_dosya.get(s['dosya'])
+        if iz is not None and eski and eski[0] == anahtar:
+            bulunan = eski[1]
+        else:
+            bulunan = []
+            for kural in kurallar['dosya']:
+                kural_uygula(kural, (s, hafta), bulunan)
+            if kurallar['kayit']:
+                for tur in ('planlanan', 'yapilan', 'siparis'):
+                    for rec in s[tur]:
+                        for kural in kurallar['kayit']:
+                            kural_uygula(kural, (tur, rec, hafta), bulunan)
+            yeniden += 1
+        if iz is not None:
+            yeni_dosya[s['dosya']] = (anahtar, bulunan)
+        dosya_sorunlari.extend(bulunan)
+
+    # Temsilci-hafta kapsamlı kurallar: girdi, o temsilci-haftanın dosyaları ve izleri
+    th_sorunlari = []
+    th_yeniden = 0
+    for rep in temsilciler:
+        for hafta in haftalar:
+            dosyalar = gruplar.get((rep, hafta[0]), [])
+            anahtar = (hafta[:3], tuple((s['dosya'], izler.get(s['dosya'])) for s in dosyalar))
+            onbelleklenir = all(iz is not None for _, iz in anahtar[1])
+            eski = eski_th.get((rep, hafta[0]))
+            if onbelleklenir and eski and eski[0] == anahtar:
+                bulunan = eski[1]
+            else:
+                bulunan = []
+                for kural in kurallar['temsilci_hafta']:
+                    kural_uygula(kural, (rep, hafta, dosyalar), bulunan)
+                th_yeniden += 1
+            if onbelleklenir:
+                yeni_th[(rep, hafta[0])] = (anahtar, bulunan)
+            th_sorunlari.extend(bulunan)
+
+    onbellek['dosya'] = yeni_dosya
+    onbellek['temsilci_hafta'] = yeni_th
+
+    for fn, etiket, neden in arsiv_disi:
+        for kural in kurallar['arsiv']:
+            kural_uygula(kural, (fn, etiket, neden), th_sorunlari)
+
+    gorulen = set()
+    sorunlar = []
+    for sorun in th_sorunlari + dosya_sorunlari:
+        if sorun[0] not in gorulen:
+            gorulen.add(sorun[0])
+            sorunlar.append(sorun)
+    sorunlar.sort(key=lambda x: ONCELIK_SIRASI.get(x[1], len(ONCELIK_SIRASI)))
+    log.info(f"Veri kalite: {len(KALITE_KURALLARI)} kural, {yeniden}/{len(sonuclar)} dosya ve "
+             f"{th_yeniden} temsilci-hafta kontrol edildi, {len(sorunlar)} sorun")
+    return sorunlar
+
+
+# ============================================================
+# EXCEL ÇIKTISI
+# ============================================================
+
+def rapor_yaz(durum, HAFTALAR, TEMSILCILER, dosya_sayisi, output, arsiv=None):
+    """Birleştirilmiş veriden MASTER_DATA çalışma kitabını oluştur ve kaydet.
+
+    arsiv verilirse arşivlenmiş haftalar Özet toplamlarına ve müşteri
+    metriklerine katılır; detay sayfalarında yalnızca HAFTALAR yer alır.
+    """
+    all_planlanan = durum['planlanan']
+    all_yapilan = durum['yapilan']
+    all_siparis = durum['siparis']
+    customers = durum['musteriler']
+    file_status = durum['dosya_durumu']
+    sorunlar = durum['sorunlar']
+    rw_ozet = temsilci_hafta_ozeti(durum)
+    bos_ozet = {'planlanan': 0, 'yapilan': 0, 'siparis': 0, 'musteri': 0, 'tutar': 0.0}
 
-    # =============================================
-    # EXCEL OLUŞTUR
-    # =============================================
     wb = openpyxl.Workbook()
 
     # -- SHEET 1: DOSYA ENVANTER --
@@ -515,12 +1238,13 @@ def master_data_olustur():
                 key = (rep, wlabel, ftype)
                 found = file_status.get(key)
                 if found:
+                    o = rw_ozet.get((rep, wlabel), bos_ozet)
                     if ftype == 'Planlanan Ziyaret':
-                        cnt = len([r for r in all_planlanan if r['rep'] == rep and r['week'] == wlabel])
+                        cnt = o['planlanan']
                     elif ftype == 'Yapılan Ziyaret':
-                        cnt = len([r for r in all_yapilan if r['rep'] == rep and r['week'] == wlabel])
+                        cnt = o['yapilan']
                     else:
-                        cnt = len([r for r in all_siparis if r['rep'] == rep and r['week'] == wlabel])
+                        cnt = o['siparis']
                     status, fill, notes = 'MEVCUT', OK_FILL, f'{cnt} kayıt' if cnt else 'Veri yok'
                 else:
                     cnt, status, fill = 0, 'EKSİK', ERR_FILL
@@ -628,24 +1352,37 @@ def master_data_olustur():
     # -- SHEET 5: SİPARİŞLER --
     ws_s = wb.create_sheet('Siparişler')
     ws_s.sheet_properties.tabColor = 'C62828'
-    s_headers = ['Temsilci', 'Hafta', 'Müşteri', 'Yetkili Kişi', 'İletişim No', 'Sipariş Tarihi', 'Ürün Adı', 'Adet', 'Fiyat', 'Kaynak']
-    s_widths = [20, 18, 28, 22, 18, 14, 35, 12, 16, 30]
+    s_headers = ['Temsilci', 'Hafta', 'Müşteri', 'Yetkili Kişi', 'İletişim No', 'Sipariş Tarihi', 'Ürün Adı', 'Adet', 'Fiyat', 'Tutar', 'Kaynak']
+    s_widths = [20, 18, 28, 22, 18, 14, 35, 12, 16, 16, 30]
     for i, (h, w) in enumerate(zip(s_headers, s_widths), 1):
         ws_s.cell(row=1, column=i, value=h)
         ws_s.column_dimensions[get_column_letter(i)].width = w
     style_header(ws_s, 1, len(s_headers))
-    s_keys = ['rep', 'week', 'musteri', 'yetkili', 'iletisim', 'tarih', 'urun', 'adet', 'fiyat', 'dosya']
+    s_keys = ['rep', 'week', 'musteri', 'yetkili', 'iletisim', 'tarih', 'urun']
     for rr_idx, rec in enumerate(all_siparis, 2):
         for ci, key in enumerate(s_keys, 1):
             ws_s.cell(row=rr_idx, column=ci, value=rec[key])
+        # Sayıya çevrilebilen adet/fiyat sayı olarak, çevrilemeyen orijinal metin olarak yazılır
+        adet_n, fiyat_n = rec['adet_n'], rec['fiyat_n']
+        ws_s.cell(row=rr_idx, column=8, value=adet_n if adet_n is not None else rec['adet'])
+        ws_s.cell(row=rr_idx, column=9, value=fiyat_n if fiyat_n is not None else rec['fiyat'])
+        ws_s.cell(row=rr_idx, column=10, value=siparis_tutari(adet_n, fiyat_n))
+        ws_s.cell(row=rr_idx, column=11, value=rec['dosya'])
         style_row(ws_s, rr_idx, len(s_headers), LIGHT_FILL if rr_idx % 2 == 0 else None)
+        ws_s.cell(row=rr_idx, column=9).number_format = SAYI_FORMAT
+        ws_s.cell(row=rr_idx, column=10).number_format = SAYI_FORMAT
     ws_s.auto_filter.ref = f'A1:{get_column_letter(len(s_headers))}{max(2, len(all_siparis) + 1)}'
 
     # -- SHEET 6: MÜŞTERİ MASTER --
     ws3 = wb.create_sheet('Müşteri Master')
     ws3.sheet_properties.tabColor = 'FF6600'
-    headers3 = ['Müşteri / Firma Adı', 'Yetkili Kişi', 'İletişim No', 'Lokasyon (İl)', 'Atanan Temsilci', 'Son Ziyaret Tarihi', 'Notlar']
-    widths3 = [35, 25, 20, 16, 22, 16, 40]
+    metrikler = musteri_metrikleri(durum['musteri_gecmisi'], datetime.now(), arsiv['musteri_ozeti'] if arsiv else None)
+    bos_metrik = {'son_ziyaret': None, 'ziyaret_sayisi': 0, 'ort_aralik': None, 'plan_edilmeyen': 0,
+                  'son_siparis': None, 'ziyaretten_beri': None, 'siparisten_beri': None}
+    headers3 = ['Müşteri / Firma Adı', 'Yetkili Kişi', 'İletişim No', 'Lokasyon (İl)', 'Atanan Temsilci', 'Son Ziyaret Tarihi',
+                'Ziyaret Sayısı', 'Ort. Ziyaret Aralığı (gün)', 'Planlanıp Ziyaret Edilmeyen', 'Son Sipariş Tarihi',
+                'Son Siparişten Beri (gün)', 'Notlar']
+    widths3 = [35, 25, 20, 16, 22, 16, 12, 14, 14, 16, 14, 40]
     for i, (h, w) in enumerate(zip(headers3, widths3), 1):
         ws3.cell(row=1, column=i, value=h)
         ws3.column_dimensions[get_column_letter(i)].width = w
@@ -653,13 +1390,19 @@ def master_data_olustur():
     row3 = 2
     for key in sorted(customers.keys()):
         c = customers[key]
+        m = metrikler.get(key, bos_metrik)
         ws3.cell(row=row3, column=1, value=c['name'])
         ws3.cell(row=row3, column=2, value=c['yetkili'])
         ws3.cell(row=row3, column=3, value=c['iletisim'])
         ws3.cell(row=row3, column=4, value=c['lokasyon'])
         ws3.cell(row=row3, column=5, value=c['rep'])
-        ws3.cell(row=row3, column=6, value=c['tarih'])
-        ws3.cell(row=row3, column=7, value='')
+        ws3.cell(row=row3, column=6, value=gun_metni(m['son_ziyaret']))
+        ws3.cell(row=row3, column=7, value=m['ziyaret_sayisi'] or '-')
+        ws3.cell(row=row3, column=8, value=round(m['ort_aralik'], 1) if m['ort_aralik'] is not None else '-')
+        ws3.cell(row=row3, column=9, value=m['plan_edilmeyen'] or '-')
+        ws3.cell(row=row3, column=10, value=gun_metni(m['son_siparis']))
+        ws3.cell(row=row3, column=11, value=m['siparisten_beri'] if m['siparisten_beri'] is not None else '-')
+        ws3.cell(row=row3, column=12, value='')
         style_row(ws3, row3, len(headers3), LIGHT_FILL if row3 % 2 == 0 else None)
         row3 += 1
     ws3.auto_filter.ref = f'A1:{get_column_letter(len(headers3))}{row3 - 1}'
@@ -669,7 +1412,10 @@ def master_data_olustur():
     ws_oz.sheet_properties.tabColor = '9C27B0'
     ws_oz.cell(row=1, column=1, value='SAHA SATIŞ HAFTALIK ÖZET RAPORU').font = Font(name='Arial', bold=True, size=14, color='1F4E79')
     ws_oz.cell(row=2, column=1, value=f'Oluşturulma: {datetime.now().strftime("%d.%m.%Y %H:%M")}').font = Font(name='Arial', size=10, color='666666')
-    ws_oz.cell(row=3, column=1, value=f'Kaynak: {len(xlsx_files)} dosya | {len(HAFTALAR)} hafta | {len(TEMSILCILER)} temsilci').font = Font(name='Arial', size=10, color='666666')
+    kaynak = f'Kaynak: {dosya_sayisi} dosya | {len(HAFTALAR)} hafta | {len(TEMSILCILER)} temsilci'
+    if arsiv and arsiv['haftalar']:
+        kaynak += f' | {len(arsiv["haftalar"])} hafta arşivde'
+    ws_oz.cell(row=3, column=1, value=kaynak).font = Font(name='Arial', size=10, color='666666')
 
     oz_headers = ['Temsilci', 'Hafta', 'Planlanan', 'Yapılan', 'Gerçekleşme %', 'Sipariş Satırı', 'Benzersiz Müşteri']
     oz_widths = [22, 20, 12, 12, 14, 14, 16]
@@ -681,13 +1427,8 @@ def master_data_olustur():
     row_oz = 6
     for rep in TEMSILCILER:
         for wlabel, _, _, _, _ in HAFTALAR:
-            plan_cnt = len([r for r in all_planlanan if r['rep'] == rep and r['week'] == wlabel])
-            yap_cnt = len([r for r in all_yapilan if r['rep'] == rep and r['week'] == wlabel])
-            sip_cnt = len([r for r in all_siparis if r['rep'] == rep and r['week'] == wlabel])
-            mus_set = set(
-                [normalize_tr(r['musteri']) for r in all_yapilan if r['rep'] == rep and r['week'] == wlabel and r['musteri']] +
-                [normalize_tr(r['musteri']) for r in all_siparis if r['rep'] == rep and r['week'] == wlabel and r['musteri']]
-            )
+            o = rw_ozet.get((rep, wlabel), bos_ozet)
+            plan_cnt, yap_cnt, sip_cnt = o['planlanan'], o['yapilan'], o['siparis']
             pct = f'{(yap_cnt / plan_cnt * 100):.0f}%' if plan_cnt > 0 else '-'
 
             ws_oz.cell(row=row_oz, column=1, value=rep)
@@ -696,70 +1437,61 @@ def master_data_olustur():
             ws_oz.cell(row=row_oz, column=4, value=yap_cnt or '-')
             ws_oz.cell(row=row_oz, column=5, value=pct)
             ws_oz.cell(row=row_oz, column=6, value=sip_cnt or '-')
-            ws_oz.cell(row=row_oz, column=7, value=len(mus_set) or '-')
+            ws_oz.cell(row=row_oz, column=7, value=o['musteri'] or '-')
             style_row(ws_oz, row_oz, len(oz_headers))
             row_oz += 1
 
+    # Arşivlenmiş haftalar temsilci başına tek satırda
+    t_plan, t_yap, t_sip = len(all_planlanan), len(all_yapilan), len(all_siparis)
+    if arsiv and arsiv['haftalar']:
+        arsiv_label = f'Arşiv ({len(arsiv["haftalar"])} hafta)'
+        arsiv_rep = defaultdict(lambda: [0, 0, 0])
+        for h in arsiv['haftalar'].values():
+            for rep, o in h['ozet'].items():
+                toplam = arsiv_rep[rep]
+                toplam[0] += o['planlanan']
+                toplam[1] += o['yapilan']
+                toplam[2] += o['siparis']
+        for rep in sorted(arsiv_rep):
+            plan_cnt, yap_cnt, sip_cnt = arsiv_rep[rep]
+            t_plan, t_yap, t_sip = t_plan + plan_cnt, t_yap + yap_cnt, t_sip + sip_cnt
+            ws_oz.cell(row=row_oz, column=1, value=rep)
+            ws_oz.cell(row=row_oz, column=2, value=arsiv_label)
+            ws_oz.cell(row=row_oz, column=3, value=plan_cnt or '-')
+            ws_oz.cell(row=row_oz, column=4, value=yap_cnt or '-')
+            ws_oz.cell(row=row_oz, column=5, value=f'{(yap_cnt / plan_cnt * 100):.0f}%' if plan_cnt > 0 else '-')
+            ws_oz.cell(row=row_oz, column=6, value=sip_cnt or '-')
+            ws_oz.cell(row=row_oz, column=7, value='-')
+            style_row(ws_oz, row_oz, len(oz_headers), INFO_FILL)
+            row_oz += 1
+
     ws_oz.cell(row=row_oz, column=1, value='TOPLAM').font = B_FONT
-    ws_oz.cell(row=row_oz, column=3, value=len(all_planlanan)).font = B_FONT
-    ws_oz.cell(row=row_oz, column=4, value=len(all_yapilan)).font = B_FONT
-    t_pct = f'{(len(all_yapilan) / len(all_planlanan) * 100):.0f}%' if all_planlanan else '-'
+    ws_oz.cell(row=row_oz, column=3, value=t_plan).font = B_FONT
+    ws_oz.cell(row=row_oz, column=4, value=t_yap).font = B_FONT
+    t_pct = f'{(t_yap / t_plan * 100):.0f}%' if t_plan else '-'
     ws_oz.cell(row=row_oz, column=5, value=t_pct).font = B_FONT
-    ws_oz.cell(row=row_oz, column=6, value=len(all_siparis)).font = B_FONT
+    ws_oz.cell(row=row_oz, column=6, value=t_sip).font = B_FONT
     style_row(ws_oz, row_oz, len(oz_headers), PURPLE_FILL)
 
     # -- SHEET 8: VERİ KALİTE SORUNLARI --
     ws4 = wb.create_sheet('Veri Kalite Sorunları')
     ws4.sheet_properties.tabColor = 'F44336'
-    headers4 = ['Öncelik', 'Kategori', 'Sorun Açıklaması', 'Etkilenen Dosya', 'Çözüm Önerisi', 'Durum']
-    widths4 = [12, 20, 50, 45, 50, 12]
+    headers4 = ['Öncelik', 'Kategori', 'Sorun Açıklaması', 'Etkilenen Dosya', 'Çözüm Önerisi', 'Durum', 'Sorun ID']
+    widths4 = [12, 20, 50, 45, 50, 12, 18]
     for i, (h, w) in enumerate(zip(headers4, widths4), 1):
         ws4.cell(row=1, column=i, value=h)
         ws4.column_dimensions[get_column_letter(i)].width = w
     style_header(ws4, 1, len(headers4))
 
-    # Otomatik sorun tespiti
-    auto_issues = []
-    for rep in TEMSILCILER:
-        for wlabel, _, _, _, _ in HAFTALAR:
-            for ftype in DOSYA_TIPLERI:
-                if (rep, wlabel, ftype) not in file_status:
-                    auto_issues.append(('KRİTİK', 'Eksik Dosya', f'{rep} - {wlabel} {ftype} dosyası eksik',
-                                        '', 'Ekipten iste veya manuel gir', 'BEKLIYOR'))
-
-    # Tarih uyumsuzlukları
-    for rec in all_yapilan + all_planlanan:
-        if rec['tarih'] and rec['week']:
-            for wlabel, ws_str, we_str, sd, ed in HAFTALAR:
-                if rec['week'] == wlabel:
-                    try:
-                        parts = rec['tarih'].split('.')
-                        rec_dt = datetime(int(parts[2]), int(parts[1]), int(parts[0]))
-                        if rec_dt < sd or rec_dt > ed:
-                            auto_issues.append(('YÜKSEK', 'Tarih Hatası',
-                                                f'{rec["rep"]}: {rec["tarih"]} tarihi {wlabel} aralığı dışında',
-                                                rec.get('dosya', ''), 'Tarihi kontrol et', 'BEKLIYOR'))
-                    except (ValueError, IndexError):
-                        pass
-                    break
-
-    # Dedup issues
-    seen_issues = set()
-    unique_issues = []
-    for issue in auto_issues:
-        key = (issue[1], issue[2][:50])
-        if key not in seen_issues:
-            seen_issues.add(key)
-            unique_issues.append(issue)
-
     row4 = 2
-    for priority, cat, desc, file, fix, status in unique_issues:
+    for issue_id, priority, cat, desc, file, fix in sorunlar:
         ws4.cell(row=row4, column=1, value=priority)
         ws4.cell(row=row4, column=2, value=cat)
         ws4.cell(row=row4, column=3, value=desc)
         ws4.cell(row=row4, column=4, value=file)
         ws4.cell(row=row4, column=5, value=fix)
-        ws4.cell(row=row4, column=6, value=status)
+        ws4.cell(row=row4, column=6, value='BEKLIYOR')
+        ws4.cell(row=row4, column=7, value=issue_id)
         if priority == 'KRİTİK':
             fill = ERR_FILL
         elif priority == 'YÜKSEK':
@@ -770,21 +1502,102 @@ def master_data_olustur():
         row4 += 1
     ws4.auto_filter.ref = f'A1:{get_column_letter(len(headers4))}{max(2, row4 - 1)}'
 
+    # -- SHEET 9: SİPARİŞ ANALİZİ --
+    urun_toplam, musteri_toplam = siparis_analizi(all_siparis, HAFTALAR)
+    ws_a = wb.create_sheet('Sipariş Analizi')
+    ws_a.sheet_properties.tabColor = 'AD1457'
+    a_headers = ['Temsilci', 'Hafta', 'Ürün', 'Sipariş Satırı', 'Toplam Adet', 'Toplam Tutar']
+    a_widths = [22, 20, 35, 14, 14, 16]
+    m_headers = ['Müşteri', 'Sipariş Satırı', 'Toplam Adet', 'Toplam Tutar']
+    m_widths = [35, 14, 14, 16]
+    m_col = len(a_headers) + 2  # Müşteri tablosu bir boş kolon sonra başlar
+    for i, (h, w) in enumerate(zip(a_headers, a_widths), 1):
+        ws_a.cell(row=1, column=i, value=h)
+        ws_a.column_dimensions[get_column_letter(i)].width = w
+    style_header(ws_a, 1, len(a_headers))
+    for i, (h, w) in enumerate(zip(m_headers, m_widths), m_col):
+        cell = ws_a.cell(row=1, column=i, value=h)
+        cell.font, cell.fill, cell.alignment, cell.border = H_FONT, H_FILL, A_CENTER, B
+        ws_a.column_dimensions[get_column_letter(i)].width = w
+
+    for rr_idx, vals in enumerate(urun_toplam, 2):
+        for ci, v in enumerate(vals, 1):
+            ws_a.cell(row=rr_idx, column=ci, value=v)
+        style_row(ws_a, rr_idx, len(a_headers), LIGHT_FILL if rr_idx % 2 == 0 else None)
+        ws_a.cell(row=rr_idx, column=6).number_format = SAYI_FORMAT
+    for rr_idx, vals in enumerate(musteri_toplam, 2):
+        for ci, v in enumerate(vals, m_col):
+            cell = ws_a.cell(row=rr_idx, column=ci, value=v)
+            cell.font, cell.border, cell.alignment = D_FONT, B, A_LEFT
+        ws_a.cell(row=rr_idx, column=m_col + 3).number_format = SAYI_FORMAT
+    ws_a.auto_filter.ref = f'A1:{get_column_letter(len(a_headers))}{max(2, len(urun_toplam) + 1)}'
+
+    # -- SHEET 10: GECİKEN MÜŞTERİLER --
+    geciken = geciken_musteriler(metrikler)
+    ws_g = wb.create_sheet('Geciken Müşteriler')
+    ws_g.sheet_properties.tabColor = 'E65100'
+    g_headers = ['Müşteri', 'Atanan Temsilci', 'Son Ziyaret Tarihi', 'Son Ziyaretten Beri (gün)', 'Beklenen Aralık (gün)',
+                 'Gecikme (gün)', 'Ziyaret Sayısı', 'Planlanıp Ziyaret Edilmeyen', 'Son Sipariş Tarihi']
+    g_widths = [35, 22, 16, 14, 14, 12, 12, 14, 16]
+    for i, (h, w) in enumerate(zip(g_headers, g_widths), 1):
+        ws_g.cell(row=1, column=i, value=h)
+        ws_g.column_dimensions[get_column_letter(i)].width = w
+    style_header(ws_g, 1, len(g_headers))
+    for rr_idx, (key, esik, gecikme) in enumerate(geciken, 2):
+        c, m = customers.get(key, {'name': key, 'rep': ''}), metrikler[key]
+        ws_g.cell(row=rr_idx, column=1, value=c['name'])
+        ws_g.cell(row=rr_idx, column=2, value=c['rep'])
+        ws_g.cell(row=rr_idx, column=3, value=gun_metni(m['son_ziyaret']) or 'Hiç ziyaret edilmedi')
+        ws_g.cell(row=rr_idx, column=4, value=m['ziyaretten_beri'] if m['ziyaretten_beri'] is not None else '-')
+        ws_g.cell(row=rr_idx, column=5, value=round(esik, 1))
+        ws_g.cell(row=rr_idx, column=6, value=round(gecikme, 1) if gecikme is not None else '-')
+        ws_g.cell(row=rr_idx, column=7, value=m['ziyaret_sayisi'] or '-')
+        ws_g.cell(row=rr_idx, column=8, value=m['plan_edilmeyen'] or '-')
+        ws_g.cell(row=rr_idx, column=9, value=gun_metni(m['son_siparis']))
+        style_row(ws_g, rr_idx, len(g_headers), ERR_FILL if gecikme is None else WARN_FILL)
+    ws_g.auto_filter.ref = f'A1:{get_column_letter(len(g_headers))}{max(2, len(geciken) + 1)}'
+
+    # -- SHEET 11: DEĞİŞİKLİKLER --
+    degisiklikler = durum['degisiklikler']
+    ws_d = wb.create_sheet('Değişiklikler')
+    ws_d.sheet_properties.tabColor = '00897B'
+    d_headers = ['İşlem', 'Kayıt Türü', 'Kayıt', 'Anahtar']
+    d_widths = [12, 12, 70, 22]
+    for i, (h, w) in enumerate(zip(d_headers, d_widths), 1):
+        ws_d.cell(row=1, column=i, value=h)
+        ws_d.column_dimensions[get_column_letter(i)].width = w
+    style_header(ws_d, 1, len(d_headers))
+    islem_adlari = {'eklendi': ('Eklendi', OK_FILL), 'degisti': ('Değişti', WARN_FILL), 'silindi': ('Silindi', ERR_FILL),
+                    'arsivlendi': ('Arşivlendi', INFO_FILL)}
+    tur_adlari = {'plan': 'Plan', 'ziyaret': 'Ziyaret', 'siparis': 'Sipariş', 'musteri': 'Müşteri'}
+    if durum['onceki_derleme'] is None:
+        ws_d.cell(row=2, column=1, value=f'İlk derleme: önceki derleme bulunamadı, {len(degisiklikler)} kayıt yeni sayıldı')
+        ws_d.cell(row=2, column=1).font = B_FONT
+    else:
+        d_satir = 2
+        for islem, anahtar, tur, etiket, _ in degisiklikler:
+            ws_d.cell(row=d_satir, column=1, value=islem_adlari[islem][0])
+            ws_d.cell(row=d_satir, column=2, value=tur_adlari[tur])
+            ws_d.cell(row=d_satir, column=3, value=etiket)
+            ws_d.cell(row=d_satir, column=4, value=anahtar)
+            style_row(ws_d, d_satir, len(d_headers), islem_adlari[islem][1])
+            d_satir += 1
+        ws_d.auto_filter.ref = f'A1:{get_column_letter(len(d_headers))}{max(2, d_satir - 1)}'
+
     # KAYDET (dosya kilidi korumalı)
-    output = DOSYA_DIZINI / CIKTI_DOSYA
     try:
         wb.save(output)
     except PermissionError:
-        log.error(f"MASTER_DATA.xlsx kaydedilemedi! Dosya başka bir programda (Excel?) açık olabilir.")
+        log.error(f"{output.name} kaydedilemedi! Dosya başka bir programda (Excel?) açık olabilir.")
         log.error(f"Lütfen dosyayı kapatıp tekrar deneyin.")
         # Geçici dosyaya yaz
-        temp_output = DOSYA_DIZINI / f'MASTER_DATA_TEMP_{datetime.now().strftime("%H%M%S")}.xlsx'
+        temp_output = output.parent / f'MASTER_DATA_TEMP_{datetime.now().strftime("%H%M%S")}.xlsx'
         wb.save(temp_output)
         log.info(f"Geçici dosyaya kaydedildi: {temp_output.name}")
         return False
 
     log.info(f'{"=" * 60}')
-    log.info(f'MASTER_DATA.xlsx oluşturuldu!')
+    log.info(f'{output.name} oluşturuldu!')
     log.info(f'{"=" * 60}')
     log.info(f'  Algılanan: {len(HAFTALAR)} hafta, {len(TEMSILCILER)} temsilci')
     log.info(f'  Sheet 1: Dosya Envanteri ({len(TEMSILCILER)} temsilci x {len(HAFTALAR)} hafta x 3 tip)')
@@ -794,70 +1607,911 @@ def master_data_olustur():
     log.info(f'  Sheet 5: Siparişler ({len(all_siparis)} kayıt)')
     log.info(f'  Sheet 6: Müşteri Master ({len(customers)} müşteri)')
     log.info(f'  Sheet 7: Özet (Performans tablosu)')
-    log.info(f'  Sheet 8: Veri Kalite Sorunları ({len(unique_issues)} sorun)')
+    log.info(f'  Sheet 8: Veri Kalite Sorunları ({len(sorunlar)} sorun)')
+    log.info(f'  Sheet 9: Sipariş Analizi ({len(urun_toplam)} ürün satırı, {len(musteri_toplam)} müşteri)')
+    log.info(f'  Sheet 10: Geciken Müşteriler ({len(geciken)} müşteri)')
+    log.info(f'  Sheet 11: Değişiklikler ({len(degisiklikler)} kayıt, önceki: {durum["onceki_derleme"] or "-"})')
     log.info(f'Eksik: {len(eksik_plan)} planlanan, {len(eksik_yap)} yapılan, {len(eksik_sip)} sipariş')
     return True
 
 
+def derle(onbellek, atla=(), durum_dosyasi=None, tutulan=None, kalite_onbellek=None):
+    """Klasörü tara, eski haftaları arşivle, raporu yaz ve durum dosyasını kaydet.
+
+    durum_dosyasi (yüklenmiş son durum) verilirse, hiçbir girdi değişmemişse ve
+    son derleme bugün yapılmışsa rapor yeniden yazılmaz. kalite_onbellek, veri kalite kurallarının önbelleğidir.
+    Dönüş: (başarılı, veri_topla parçası veya None, birleştirilmiş veri veya
+    klasör okunamadıysa None).
+    """
+    output = DOSYA_DIZINI / CIKTI_DOSYA
+    arsiv = arsiv_yukle(DOSYA_DIZINI) if tutulan else None
+    parca = veri_topla(DOSYA_DIZINI, onbellek, atla, arsiv['haftalar'] if arsiv else ())
+    if parca is None:
+        return False, None, None
+    if arsiv is not None and haftalari_arsivle(parca, arsiv, tutulan, onbellek, DOSYA_DIZINI):
+        parca['degisen'] += 1
+    # Rapor yazılmasa da birleştirilmiş veri kurulur: servis modu tam veri kümesini bellekte tutar
+    durum = sonuclari_birlestir(parca['sonuclar'])
+    durum['sorunlar'] = kalite_kontrol(parca['sonuclar'], parca['haftalar'], parca['temsilciler'],
+                                       parca['izler'], kalite_onbellek, parca['arsiv_disi'])
+    if arsiv:
+        # Arşivdeki müşteriler önce gelir (eski haftalar), ilk görülen kayıt kuralı korunur
+        musteriler = {k: dict(c) for k, c in arsiv['musteriler'].items()}
+        musterileri_birlestir(musteriler, durum['musteriler'])
+        durum['musteriler'] = musteriler
+    if (durum_dosyasi and parca['degisen'] == 0 and cikti_izi(output) == durum_dosyasi['cikti_izi']
+            and durum_dosyasi.get('program_izi') == cikti_izi(Path(__file__))
+            and durum_dosyasi.get('tutulan') == tutulan
+            and durum_dosyasi.get('arsiv_disi', []) == [list(x) for x in parca['arsiv_disi']]
+            # Müşteri metrikleri ve Geciken Müşteriler bugünün tarihine bağlı: yeni günde rapor yenilenir
+            and durum_dosyasi['olusturma'].date() == datetime.now().date()):
+        log.info(f"Değişiklik yok, {output.name} güncel.")
+        return True, parca, durum
+
+    onceki = anahtar_yukle(DOSYA_DIZINI)
+    anahtarlar = kayit_anahtarlari(durum)
+    durum['degisiklikler'] = degisiklikleri_bul(onceki, anahtarlar, arsiv['haftalar'] if arsiv else ())
+    durum['onceki_derleme'] = onceki['olusturma'] if onceki else None
+    if not rapor_yaz(durum, parca['haftalar'], parca['temsilciler'], parca['dosya_sayisi'], output, arsiv):
+        return False, parca, durum
+    degisiklik_kaydet(DOSYA_DIZINI, anahtarlar, durum['degisiklikler'], onceki)
+    durum_kaydet(DOSYA_DIZINI, onbellek, parca, output, tutulan, kalite_onbellek)
+    return True, parca, durum
+
+
+def guncelle(onbellek, atla=(), durum_dosyasi=None, tutulan=None, kalite_onbellek=None, servis=None):
+    """Derlemeyi çalıştır; servis verilirse sonucu bellekteki veri kümesine aktar.
+
+    Dönüş: (başarılı, veri_topla parçası veya None).
+    """
+    baslangic = time.monotonic()
+    basarili, parca, durum = derle(onbellek, atla, durum_dosyasi, tutulan, kalite_onbellek)
+    if servis is not None:
+        servis.derleme_bitti(basarili, parca, durum, time.monotonic() - baslangic)
+    return basarili, parca
+
+
+def master_data_olustur(onbellek=None, atla=(), soguk=False, tutulan=None, kalite_onbellek=None, servis=None):
+    """Klasörü tarayıp MASTER_DATA'yı oluştur.
+
+    Önbellek boşsa (ve soguk=False ise) son başarılı derlemenin durum dosyası
+    yüklenir ve yalnızca değişen dosyalar okunur; hiçbir şey değişmemişse ve
+    çıktı dosyası yerindeyse rapor yeniden yazılmaz. Kalite kuralı sonuçları
+    yalnızca script değişmemişse durum dosyasından alınır.
+    Dönüş: (başarılı, veri_topla parçası veya None).
+    """
+    if onbellek is None:
+        onbellek = {}
+    if kalite_onbellek is None:
+        kalite_onbellek = {}
+    durum_dosyasi = None
+    if not onbellek and not soguk:
+        durum_dosyasi = durum_yukle(DOSYA_DIZINI)
+        if durum_dosyasi:
+            onbellek.update(durum_dosyasi['dosyalar'])
+            if durum_dosyasi.get('program_izi') == cikti_izi(Path(__file__)):
+                kalite_onbellek.update(durum_dosyasi.get('kalite') or {})
+
+    return guncelle(onbellek, atla, durum_dosyasi, tutulan, kalite_onbellek, servis)
+
+
+# ============================================================
+# DURUM DOSYASI (hızlı başlangıç)
+# ============================================================
+# Her başarılı derlemeden sonra dosya bazlı sonuçlar (kayıtlar ve müşteri
+# katkıları), dosya izleri ve algılanan hafta/temsilciler JSON olarak yazılır.
+# Başlangıçta yüklenir; yalnızca izi değişen dosyalar yeniden okunur. Dosya,
+# ekiplerin dosya kopyaladığı paylaşımlı klasörde durduğu için pickle
+# kullanılmaz: JSON okumak kod çalıştırmaz. JSON'da demetler liste olarak
+# saklanır ve yüklerken demete çevrilir.
+
+DURUM_SURUM = 3  # 2: sayfa aralığı (satir_sayisi / son_veri_satiri) eklendi; 3: pickle yerine JSON
+
+
+def cikti_izi(output):
+    """Dosyanın izi; dosya yoksa None."""
+    try:
+        return dosya_izi(output)
+    except FileNotFoundError:
+        return None
+
+
+def demete_cevir(v):
+    """JSON'dan gelen iç içe listeleri demete çevir (izler ve önbellek anahtarları için)."""
+    if isinstance(v, list):
+        return tuple(demete_cevir(x) for x in v)
+    return v
+
+
+def durum_kaydet(dizin, onbellek, parca, output, tutulan=None, kalite=None):
+    """Derleme durumunu durum dosyasına yaz."""
+    kalite = kalite or {}
+    veri = {
+        'surum': DURUM_SURUM, 'dizin': str(dizin), 'olusturma': datetime.now().isoformat(timespec='seconds'),
+        'haftalar': [[label, ws, we] for label, ws, we, _, _ in parca['haftalar']],
+        'temsilciler': parca['temsilciler'],
+        'dosyalar': onbellek, 'cikti_izi': cikti_izi(output), 'tutulan': tutulan,
+        'arsiv_disi': parca.get('arsiv_disi', []),
+        'program_izi': cikti_izi(Path(__file__)),  # Script güncellenirse rapor yeniden yazılır
+        'kalite': {
+            'dosya': kalite.get('dosya', {}),
+            # JSON anahtarı metin olmalı: temsilci-hafta önbelleği liste olarak saklanır
+            'temsilci_hafta': [[rep, week, anahtar, bulunan]
+                               for (rep, week), (anahtar, bulunan) in kalite.get('temsilci_hafta', {}).items()],
+        },
+    }
+    yol = dizin / DURUM_DOSYA
+    gecici = yol.with_name(yol.name + '.tmp')
+    try:
+        with open(gecici, 'w', encoding='utf-8') as f:
+            json.dump(veri, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(gecici, yol)
+    except OSError as e:
+        log.warning(f"Durum dosyası yazılamadı: {e}")
+
+
+def durum_yukle(dizin):
+    """Durum dosyasını yükle; yoksa, bozuksa veya sürüm uyumsuzsa None döndür."""
+    yol = dizin / DURUM_DOSYA
+    if not yol.exists():
+        return None
+    try:
+        with open(yol, encoding='utf-8') as f:
+            veri = json.load(f)
+        if not isinstance(veri, dict) or veri.get('surum') != DURUM_SURUM:
+            log.info("Durum dosyası sürümü farklı, tam tarama yapılacak.")
+            return None
+        for kayit in veri['dosyalar'].values():
+            kayit['iz'] = demete_cevir(kayit['iz'])
+            if not isinstance(kayit['sonuc'], dict) or not isinstance(kayit['sonuc']['rep'], str):
+                raise TypeError('dosya kaydı geçersiz')
+        veri['cikti_izi'] = demete_cevir(veri['cikti_izi'])
+        veri['program_izi'] = demete_cevir(veri['program_izi'])
+        veri['olusturma'] = datetime.fromisoformat(veri['olusturma'])
+        veri['kalite'] = {
+            'dosya': {fn: (demete_cevir(anahtar), bulunan) for fn, (anahtar, bulunan) in veri['kalite']['dosya'].items()},
+            'temsilci_hafta': {(rep, week): (demete_cevir(anahtar), bulunan)
+                               for rep, week, anahtar, bulunan in veri['kalite']['temsilci_hafta']},
+        }
+    except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+        log.warning(f"Durum dosyası okunamadı, tam tarama yapılacak: {e}")
+        return None
+    log.info(f"Durum dosyası yüklendi: {len(veri['dosyalar'])} dosya "
+             f"({veri['olusturma'].strftime('%d.%m.%Y %H:%M')})")
+    return veri
+
+
+# ============================================================
+# HAFTA ARŞİVİ (--tutma N)
+# ============================================================
+# Son N hafta MASTER_DATA'da detaylı tutulur. Daha eski haftalar bir kez okunup
+# ARSIV_DOSYA'ya katlanır: temsilci bazında haftalık sayılar, müşteri master
+# katkıları ve müşteri geçmiş özetleri. Arşivdeki haftaların kaynak dosyaları
+# sonraki derlemelerde okunmaz; Özet toplamları arşivi de içerir.
+# Arşivi sıfırlamak için ARSIV_DOSYA silinir.
+
+ARSIV_BICIM = 'saha-satis-arsiv'
+ARSIV_SURUM = 1
+
+
+def arsiv_yukle(dizin):
+    """Arşiv deposunu yükle; yoksa boş arşiv döndür."""
+    yol = dizin / ARSIV_DOSYA
+    if yol.exists():
+        try:
+            with open(yol, encoding='utf-8') as f:
+                arsiv = json.load(f)
+            if arsiv.get('bicim') == ARSIV_BICIM and arsiv.get('surum') == ARSIV_SURUM:
+                return arsiv
+            log.warning(f"{yol.name} desteklenmeyen arşiv sürümü, yok sayılıyor")
+        except (OSError, ValueError) as e:
+            log.warning(f"{yol.name} okunamadı, yok sayılıyor: {e}")
+    return {'bicim': ARSIV_BICIM, 'surum': ARSIV_SURUM, 'haftalar': {}, 'musteriler': {}, 'musteri_ozeti': {}}
+
+
+def arsiv_kaydet(dizin, arsiv):
+    """Arşiv deposunu haftalar tarih sırasında olacak şekilde yaz; yazılamazsa False döndür."""
+    arsiv['haftalar'] = dict(sorted(arsiv['haftalar'].items(),
+                                    key=lambda kv: datetime.strptime(kv[1]['baslangic'], '%d.%m.%Y')))
+    arsiv['guncelleme'] = datetime.now().isoformat(timespec='seconds')
+    yol = dizin / ARSIV_DOSYA
+    gecici = yol.with_name(yol.name + '.tmp')
+    try:
+        with open(gecici, 'w', encoding='utf-8') as f:
+            json.dump(arsiv, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(gecici, yol)
+    except OSError as e:
+        log.warning(f"Arşiv yazılamadı, bu derlemede arşivleme atlandı: {e}")
+        return False
+    return True
+
+
+def haftalari_arsivle(parca, arsiv, tutulan, onbellek, dizin):
+    """Son 'tutulan' haftadan eski haftaları arşive katla, arşivi yaz ve parçadan çıkar.
+
+    Kopyalaması süren (yarım) dosyası olan haftalar bir sonraki derlemeye bırakılır.
+    Arşiv yazılamazsa parça ve önbellek değiştirilmez; haftalar sonraki derlemede
+    yeniden denenir. Arşiv değiştiyse True döner.
+    """
+    eski = parca['haftalar'][:-tutulan] if len(parca['haftalar']) > tutulan else []
+    # Yeni ve henüz kopyalanan dosyanın sonucu yok: haftası dosya adından bulunur
+    yarim_haftalar = {hafta_bul(fn, parca['haftalar']) for fn in parca['yarim_dosyalar']}
+    eski = [h for h in eski if h[0] not in yarim_haftalar]
+    if not eski:
+        return False
+
+    etiketler = {h[0] for h in eski}
+    arsivlenen = [s for s in parca['sonuclar'] if s['week'] in etiketler]
+    durum = sonuclari_birlestir(arsivlenen)
+    rw_ozet = temsilci_hafta_ozeti(durum)
+    # Haftanın tüm dosyaları kaydedilir (atlanan/okunamayanlar dahil); yalnızca
+    # arşivden sonra eklenen veya değişen dosyalar arşiv dışı sayılır
+    hafta_dosyalari = defaultdict(list)
+    for fn in parca['dosyalar']:
+        hafta_dosyalari[hafta_bul(fn, eski)].append(fn)
+    yeni = copy.deepcopy(arsiv)
+    for label, ws, we, _, _ in eski:
+        dosyalar = sorted(hafta_dosyalari[label])
+        izler = {}
+        for fn in dosyalar:
+            try:
+                # Arşivlendikten sonra değişen dosyaları fark etmek için
+                izler[fn] = parca['izler'][fn] if fn in parca['izler'] else dosya_izi(dizin / fn)
+            except OSError:
+                pass
+        yeni['haftalar'][label] = {
+            'baslangic': ws, 'bitis': we, 'dosyalar': dosyalar, 'izler': izler,
+            'ozet': {rep: o for (rep, w), o in sorted(rw_ozet.items()) if w == label},
+        }
+    musterileri_birlestir(yeni['musteriler'], durum['musteriler'])
+    ozetleri_birlestir(yeni['musteri_ozeti'], gecmis_ozeti(durum['musteri_gecmisi']))
+    if not arsiv_kaydet(dizin, yeni):
+        return False
+    arsiv.clear()
+    arsiv.update(yeni)
+
+    parca['sonuclar'] = [s for s in parca['sonuclar'] if s['week'] not in etiketler]
+    parca['haftalar'] = [h for h in parca['haftalar'] if h[0] not in etiketler]
+    for s in arsivlenen:
+        onbellek.pop(s['dosya'], None)
+    log.info(f"Arşivlendi: {len(eski)} hafta, {len(arsivlenen)} dosya ({eski[0][0]} - {eski[-1][0]})")
+    return True
+
+
+# ============================================================
+# DEĞİŞİKLİK AKIŞI
+# ============================================================
+# Her plan, ziyaret, sipariş ve müşteri kaydı kimlik alanlarından türetilen
+# kararlı bir anahtar ve içerik özeti alır. Önceki derlemenin anahtarları
+# ANAHTAR_DOSYA'da tutulur; her derlemede eklenen, silinen ve değişen kayıtlar
+# DEGISIKLIK_DOSYA'ya (JSON-lines: ilk satır başlık, sonraki her satır bir
+# değişiklik) ve 'Değişiklikler' sayfasına yazılır. Başlıktaki 'onceki', akışın
+# hangi derlemeye göre hesaplandığıdır; tüketici son uyguladığı derleme bu
+# değilse tam yükleme yapmalıdır. --tutma ile arşive katlanan haftaların
+# kayıtları 'silindi' değil 'arsivlendi' olarak bildirilir: bu kayıtlar Özet
+# toplamlarında ve müşteri metriklerinde yaşamaya devam eder.
+
+DEGISIKLIK_BICIM = 'saha-satis-degisiklik'
+ANAHTAR_BICIM = 'saha-satis-anahtar'
+DEGISIKLIK_SURUM = 3  # 2: 'arsivlendi' işlemi, anahtar kayıtlarında hafta; 3: müşteri özeti yalnızca master alanları
+MUSTERI_ALANLARI = ('name', 'yetkili', 'iletisim', 'lokasyon', 'rep')  # Müşteri Master'da gösterilen alanlar
+
+
+def kayit_anahtarlari(durum):
+    """Kayıtların kararlı anahtarlarını üret.
+
+    Kimlik: plan/ziyaret için temsilci+müşteri+tarih, sipariş için ayrıca ürün,
+    müşteri için normalize ad. Müşterinin içerik özeti yalnızca Müşteri Master'da
+    gösterilen alanları kapsar. Aynı kimlik tekrar ederse sıra numarası eklenir.
+    Dönüş: {anahtar: (tur, içerik özeti, etiket, kayıt)}.
+    """
+    anahtarlar = {}
+    sayac = defaultdict(int)
+
+    def ekle(tur, kimlik, etiket, kayit):
+        sayac[(tur, kimlik)] += 1
+        if sayac[(tur, kimlik)] > 1:
+            kimlik = kimlik + (sayac[(tur, kimlik)],)
+        icerik = json.dumps(kayit, sort_keys=True, ensure_ascii=False, default=str)
+        anahtarlar[kararli_kimlik(tur.upper(), kimlik)] = (
+            tur, hashlib.sha1(icerik.encode('utf-8')).hexdigest()[:12], etiket, kayit)
+
+    for tur, kayitlar in (('plan', durum['planlanan']), ('ziyaret', durum['yapilan'])):
+        for rec in kayitlar:
+            ekle(tur, (rec['rep'], normalize_tr(rec['musteri']), rec['tarih']),
+                 f"{rec['rep']} | {rec['musteri']} | {rec['tarih']}", rec)
+    for rec in durum['siparis']:
+        ekle('siparis', (rec['rep'], normalize_tr(rec['musteri']), rec['tarih'], rec['urun']),
+             f"{rec['rep']} | {rec['musteri']} | {rec['tarih']} | {rec['urun']}", rec)
+    for cust_key, c in durum['musteriler'].items():
+        ekle('musteri', (cust_key,), c['name'], {k: c[k] for k in MUSTERI_ALANLARI})
+    return anahtarlar
+
+
+def anahtar_yukle(dizin):
+    """Önceki derlemenin anahtarlarını yükle; yoksa veya okunamazsa None."""
+    yol = dizin / ANAHTAR_DOSYA
+    if not yol.exists():
+        return None
+    try:
+        with open(yol, encoding='utf-8') as f:
+            veri = json.load(f)
+    except (OSError, ValueError) as e:
+        log.warning(f"{yol.name} okunamadı, değişiklik akışı tam liste olacak: {e}")
+        return None
+    if veri.get('bicim') != ANAHTAR_BICIM or veri.get('surum') not in (1, 2, DEGISIKLIK_SURUM):
+        log.warning(f"{yol.name} desteklenmeyen sürüm, değişiklik akışı tam liste olacak")
+        return None
+    if veri['surum'] < 3:
+        # Eski müşteri özetleri son satır tarihini de kapsıyordu: karşılaştırılamaz, değişmemiş sayılır
+        for kayit in veri['kayitlar'].values():
+            if kayit[0] == 'musteri':
+                kayit[1] = None
+    return veri
+
+
+def degisiklikleri_bul(onceki, anahtarlar, arsiv_haftalari=()):
+    """Önceki derlemeye göre değişiklik listesi: [(işlem, anahtar, tur, etiket, kayıt)].
+
+    İşlem 'eklendi', 'degisti', 'silindi' veya 'arsivlendi' (kaybolan kaydın
+    haftası artık arşivde); silinen/arşivlenen kayıtların kaydı None'dır.
+    Önceki derleme yoksa tüm kayıtlar eklenmiş sayılır.
+    """
+    eski = onceki['kayitlar'] if onceki else {}
+    eklenen, degisen = [], []
+    for anahtar, (tur, icerik, etiket, kayit) in anahtarlar.items():
+        if anahtar not in eski:
+            eklenen.append(('eklendi', anahtar, tur, etiket, kayit))
+        elif eski[anahtar][1] not in (None, icerik):
+            degisen.append(('degisti', anahtar, tur, etiket, kayit))
+    silinen, arsivlenen = [], []
+    for anahtar, (tur, _, etiket, *hafta) in eski.items():
+        if anahtar in anahtarlar:
+            continue
+        if hafta and hafta[0] in arsiv_haftalari:
+            arsivlenen.append(('arsivlendi', anahtar, tur, etiket, None))
+        else:
+            silinen.append(('silindi', anahtar, tur, etiket, None))
+    return eklenen + degisen + silinen + arsivlenen
+
+
+def degisiklik_kaydet(dizin, anahtarlar, degisiklikler, onceki):
+    """Değişiklik akışını ve bu derlemenin anahtarlarını yaz."""
+    olusturma = datetime.now().isoformat(timespec='seconds')
+    sayilar = {islem: 0 for islem in ('eklendi', 'degisti', 'silindi', 'arsivlendi')}
+    for d in degisiklikler:
+        sayilar[d[0]] += 1
+    baslik = {'tur': 'baslik', 'bicim': DEGISIKLIK_BICIM, 'surum': DEGISIKLIK_SURUM,
+              'olusturma': olusturma, 'onceki': onceki['olusturma'] if onceki else None, **sayilar}
+    try:
+        yol = dizin / DEGISIKLIK_DOSYA
+        gecici = yol.with_name(yol.name + '.tmp')
+        with open(gecici, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(baslik, ensure_ascii=False) + '\n')
+            for islem, anahtar, tur, etiket, kayit in degisiklikler:
+                satir = {'islem': islem, 'anahtar': anahtar, 'tur': tur, 'etiket': etiket}
+                if kayit is not None:
+                    satir['kayit'] = kayit
+                f.write(json.dumps(satir, ensure_ascii=False, default=str) + '\n')
+        os.replace(gecici, yol)
+
+        # Anahtarlar akıştan sonra yazılır: akış yazılamazsa sonraki derleme aynı farkı yeniden üretir
+        yol = dizin / ANAHTAR_DOSYA
+        gecici = yol.with_name(yol.name + '.tmp')
+        with open(gecici, 'w', encoding='utf-8') as f:
+            json.dump({'bicim': ANAHTAR_BICIM, 'surum': DEGISIKLIK_SURUM, 'olusturma': olusturma,
+                       'kayitlar': {a: [tur, icerik, etiket, kayit.get('week')]
+                                    for a, (tur, icerik, etiket, kayit) in anahtarlar.items()}},
+                      f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(gecici, yol)
+    except OSError as e:
+        log.warning(f"Değişiklik akışı yazılamadı: {e}")
+        return
+    log.info(f"Değişiklik akışı: {sayilar['eklendi']} eklendi, {sayilar['degisti']} değişti, "
+             f"{sayilar['silindi']} silindi, {sayilar['arsivlendi']} arşivlendi -> {DEGISIKLIK_DOSYA}")
+
+
+# ============================================================
+# PARÇA / BİRLEŞTİRME MODU (--map / --merge)
+# ============================================================
+# Her bölge klasörü ayrı çalıştırılıp bir ara sonuç (parça) dosyası üretir.
+# Parça, JSON-lines biçimindedir: ilk satır başlık (sürüm, dizin, algılanan
+# hafta/temsilciler), sonraki her satır bir dosyanın okunmuş sonucudur.
+
+PARCA_BICIM = 'saha-satis-parca'
+PARCA_SURUM = 3  # 2: sipariş kayıtlarına adet_n / fiyat_n eklendi; 3: başlığa dosya listesi eklendi
+
+
+def parca_yaz(parca, yol):
+    """Ara sonucu JSON-lines parça dosyasına yaz."""
+    baslik = {
+        'tur': 'baslik', 'bicim': PARCA_BICIM, 'surum': PARCA_SURUM,
+        'dizin': parca['dizin'], 'dosya_sayisi': parca['dosya_sayisi'], 'dosyalar': parca['dosyalar'],
+        'haftalar': [[label, ws, we] for label, ws, we, _, _ in parca['haftalar']],
+        'temsilciler': parca['temsilciler'],
+        'olusturma': datetime.now().isoformat(timespec='seconds'),
+    }
+    gecici = yol.with_name(yol.name + '.tmp')
+    with open(gecici, 'w', encoding='utf-8') as f:
+        f.write(json.dumps(baslik, ensure_ascii=False) + '\n')
+        for s in parca['sonuclar']:
+            f.write(json.dumps(dict(s, tur='dosya'), ensure_ascii=False) + '\n')
+    os.replace(gecici, yol)
+
+
+def parca_oku(yol):
+    """Parça dosyasını oku; biçim veya sürüm uyumsuzsa ValueError fırlat."""
+    with open(yol, encoding='utf-8') as f:
+        baslik = json.loads(f.readline() or '{}')
+        if baslik.get('bicim') != PARCA_BICIM:
+            raise ValueError(f'{yol.name} bir parça dosyası değil')
+        surum = baslik.get('surum')
+        if surum not in (1, 2, PARCA_SURUM):
+            raise ValueError(f'{yol.name} desteklenmeyen parça sürümü: {surum}')
+        sonuclar = []
+        for line in f:
+            if line.strip():
+                s = json.loads(line)
+                s.pop('tur', None)
+                if surum == 1:
+                    for rec in s['siparis']:
+                        rec['adet_n'] = sayi_cevir(rec['adet'])
+                        rec['fiyat_n'] = sayi_cevir(rec['fiyat'])
+                sonuclar.append(s)
+
+    haftalar = []
+    for label, ws, we in baslik['haftalar']:
+        haftalar.append((label, ws, we, datetime.strptime(ws, '%d.%m.%Y'), datetime.strptime(we, '%d.%m.%Y')))
+    # Sürüm 3 öncesi parçalarda dosya listesi yok: yalnızca okunan dosyalar bilinir
+    dosyalar = baslik['dosyalar'] if surum == PARCA_SURUM else [s['dosya'] for s in sonuclar]
+    return {'dizin': baslik['dizin'], 'dosya_sayisi': baslik['dosya_sayisi'], 'dosyalar': dosyalar,
+            'haftalar': haftalar, 'temsilciler': baslik['temsilciler'], 'sonuclar': sonuclar}
+
+
+def parcalari_birlestir(parcalar):
+    """Parçaları tek parçada birleştir.
+
+    Dosya sonuçları dosya adına göre sıralanır; böylece sonuç, tüm dosyalar tek
+    klasörde taranmış gibi olur ve parçaların veriliş sırasından bağımsızdır.
+    Hafta ve temsilciler tüm parçaların dosya adlarından yeniden algılanır; her
+    dosyanın temsilci/haftası bu listelere göre yeniden bulunur. Aynı dosya
+    birden fazla parçada varsa dizin adına göre ilk gelen kullanılır.
+    """
+    dosyalar = set()
+    sonuclar = []
+    gorulen_dosyalar = set()
+    dosya_sayisi = 0
+
+    for parca in sorted(parcalar, key=lambda p: p['dizin']):
+        # Tekrarlanan dosya kaynak sayısına bir kez girer
+        dosya_sayisi += parca['dosya_sayisi'] - len(dosyalar.intersection(parca['dosyalar']))
+        dosyalar.update(parca['dosyalar'])
+        for s in parca['sonuclar']:
+            if s['dosya'] in gorulen_dosyalar:
+                log.warning(f"  ATLA: {s['dosya']} birden fazla parçada var ({parca['dizin']})")
+                continue
+            gorulen_dosyalar.add(s['dosya'])
+            sonuclar.append(s)
+
+    # Tek klasör taramasıyla aynı algılama: yıl tahmini ve isim yazımı parçaya göre değişmesin
+    haftalar = hafta_algila(sorted(dosyalar))
+    temsilciler = temsilci_algila(sorted(dosyalar))
+    birlesik = []
+    for s in sorted(sonuclar, key=lambda s: s['dosya']):
+        rep, week = temsilci_bul(s['dosya'], temsilciler), hafta_bul(s['dosya'], haftalar)
+        if not rep or not week:
+            log.warning(f"  ATLA: {s['dosya']} (temsilci={rep or '?'}, hafta={week or '?'})")
+            continue
+        if (rep, week) != (s['rep'], s['week']):
+            s['rep'], s['week'] = rep, week
+            for tur in ('planlanan', 'yapilan', 'siparis'):
+                for rec in s[tur]:
+                    rec['rep'], rec['week'] = rep, week
+            for c in s['musteriler'].values():
+                c['rep'] = rep
+        birlesik.append(s)
+
+    return {'dizin': ', '.join(sorted(p['dizin'] for p in parcalar)), 'dosya_sayisi': dosya_sayisi,
+            'haftalar': haftalar, 'temsilciler': temsilciler, 'sonuclar': birlesik}
+
+
+def parca_olustur(dizin, cikti):
+    """Bir klasörü tarayıp parça dosyası üret (map)."""
+    parca = veri_topla(dizin)
+    if parca is None:
+        return False
+    parca_yaz(parca, cikti)
+    kayit = sum(len(s['planlanan']) + len(s['yapilan']) + len(s['siparis']) for s in parca['sonuclar'])
+    log.info(f"Parça yazıldı: {cikti} ({len(parca['sonuclar'])} dosya, {kayit} kayıt)")
+    return True
+
+
+def parcalardan_master(yollar, cikti):
+    """Parça dosyalarını birleştirip master raporu oluştur (merge)."""
+    parcalar = []
+    for yol in yollar:
+        try:
+            parcalar.append(parca_oku(yol))
+        except (OSError, ValueError, KeyError) as e:
+            log.error(f"  HATA: {yol} - {e}")
+            return False
+        log.info(f"  Parça: {yol.name} ({parcalar[-1]['dizin']})")
+    if not parcalar:
+        log.error("Birleştirilecek parça yok!")
+        return False
+
+    parca = parcalari_birlestir(parcalar)
+    durum = sonuclari_birlestir(parca['sonuclar'])
+    durum['sorunlar'] = kalite_kontrol(parca['sonuclar'], parca['haftalar'], parca['temsilciler'])
+    onceki = anahtar_yukle(cikti.parent)
+    anahtarlar = kayit_anahtarlari(durum)
+    durum['degisiklikler'] = degisiklikleri_bul(onceki, anahtarlar)
+    durum['onceki_derleme'] = onceki['olusturma'] if onceki else None
+    if not rapor_yaz(durum, parca['haftalar'], parca['temsilciler'], parca['dosya_sayisi'], cikti):
+        return False
+    degisiklik_kaydet(cikti.parent, anahtarlar, durum['degisiklikler'], onceki)
+    return True
+
+
 # ============================================================
 # İZLEME MODU (--izle)
 # ============================================================
 
-def izleme_modu():
-    """Klasördeki değişiklikleri izle, yeni dosya gelince otomatik çalıştır."""
-    import time
-    DEBOUNCE_SANIYE = 3  # Değişiklik algılandıktan sonra bekleme süresi
+class GuncellemeZamanlayici:
+    """İzleme modunda klasör olaylarını tek bir bekleyen güncelleme işinde birleştirir.
+
+    Değişen her dosya, boyutu ve değişim zamanı STABIL_SANIYE boyunca sabit
+    kalana kadar bekletilir (SMB üzerinden kopyalama sürüyor olabilir).
+    Güncellemeler arasında en az MIN_GUNCELLEME_ARALIGI saniye bırakılır; ilk
+    olaydan bu yana MAKS_GECIKME geçtiyse hâlâ kopyalanan dosyalar beklemede
+    bırakılarak hazır olanlarla güncelleme yine de yapılır.
+    """
+
+    def __init__(self, izler, simdi):
+        self.izler = dict(izler)            # Son görülen dosya izleri
+        self.bekleyen = {}                  # {dosya_adı: son değişim zamanı}
+        self.silinen = set()
+        self.denemeler = defaultdict(int)   # Yarım dosyaların yeniden deneme sayısı
+        self.ilk_olay = None
+        self.son_guncelleme = simdi
+
+    def olaylari_isle(self, izler, simdi):
+        """Güncel klasör izlerini öncekilerle karşılaştır, değişenleri kuyruğa al."""
+        for fn, iz in izler.items():
+            if self.izler.get(fn) != iz:
+                if fn not in self.bekleyen:
+                    log.info(f"Değişiklik: {'~' if fn in self.izler else '+'} {fn}")
+                self.bekleyen[fn] = simdi
+                self.silinen.discard(fn)
+        for fn in set(self.izler) - set(izler):
+            log.info(f"Değişiklik: - {fn}")
+            self.bekleyen.pop(fn, None)
+            self.denemeler.pop(fn, None)
+            self.silinen.add(fn)
+        self.izler = dict(izler)
+        if (self.bekleyen or self.silinen) and self.ilk_olay is None:
+            self.ilk_olay = simdi
+
+    def kararsiz_dosyalar(self, simdi):
+        """Boyutu/tarihi henüz STABIL_SANIYE kadar sabit kalmamış dosyalar."""
+        return {fn for fn, t in self.bekleyen.items() if simdi - t < STABIL_SANIYE}
+
+    def hazir_mi(self, simdi):
+        """Bekleyen iş şimdi çalıştırılmalı mı?"""
+        if self.ilk_olay is None or simdi - self.son_guncelleme < MIN_GUNCELLEME_ARALIGI:
+            return False
+        kararsiz = self.kararsiz_dosyalar(simdi)
+        if not kararsiz:
+            return True
+        hazir_var = self.silinen or len(kararsiz) < len(self.bekleyen)
+        return bool(hazir_var) and simdi - self.ilk_olay >= MAKS_GECIKME
+
+    def is_al(self, simdi):
+        """Hazır değişiklikleri işe al; atlanması gereken (kararsız) dosyaları döndür."""
+        kararsiz = self.kararsiz_dosyalar(simdi)
+        if kararsiz:
+            log.info(f"{len(kararsiz)} dosyanın kopyalanması sürüyor, sonraki güncellemeye bırakıldı")
+        self.bekleyen = {fn: t for fn, t in self.bekleyen.items() if fn in kararsiz}
+        self.silinen = set()
+        self.ilk_olay = simdi if self.bekleyen else None
+        return kararsiz
+
+    def tamamlandi(self, yarim_dosyalar, simdi):
+        """Güncelleme bitti: yarım okunan dosyaları (yalnızca onları) yeniden kuyruğa al."""
+        self.son_guncelleme = simdi
+        yarim = set(yarim_dosyalar)
+        for fn in list(self.denemeler):
+            if fn not in yarim:
+                del self.denemeler[fn]
+        for fn in yarim:
+            if fn in self.bekleyen:
+                continue  # Zaten kararsız olarak bekliyor
+            self.denemeler[fn] += 1
+            if self.denemeler[fn] > YARIM_DOSYA_DENEME:
+                log.error(f"  HATA: {fn} {YARIM_DOSYA_DENEME} denemede okunamadı, dosya değişene kadar atlanacak")
+                del self.denemeler[fn]
+                continue
+            self.bekleyen[fn] = simdi
+        if self.bekleyen and self.ilk_olay is None:
+            self.ilk_olay = simdi
+
+
+def izleme_modu(onbellek=None, tutulan=None, kalite_onbellek=None, servis=None, yarim_dosyalar=()):
+    """Klasördeki değişiklikleri izle, dosyalar tamamlanınca MASTER_DATA'yı güncelle.
+
+    servis verilirse derleme sonuçları servise aktarılır ve servisten gelen
+    güncelleme isteği zamanlayıcı beklenmeden işlenir. yarim_dosyalar, ilk
+    derlemede yarım okunan dosyalardır; bunlar yeniden denenmek üzere kuyruğa alınır.
+    """
+    if onbellek is None:
+        onbellek = {}
+    if kalite_onbellek is None:
+        kalite_onbellek = {}
 
     log.info("=" * 60)
     log.info("DOSYA İZLEME MODU AKTİF")
     log.info(f"Dizin: {DOSYA_DIZINI}")
-    log.info("Yeni .xlsx dosyası eklendiğinde MASTER_DATA otomatik güncellenir.")
+    log.info("Yeni/değişen .xlsx dosyası tamamlandığında MASTER_DATA otomatik güncellenir.")
     log.info("Durdurmak için Ctrl+C")
     log.info("=" * 60)
 
-    last_files = set(dosya_listesi_al(DOSYA_DIZINI))
-    log.info(f"Mevcut dosya sayısı: {len(last_files)}")
+    zamanlayici = GuncellemeZamanlayici(klasor_izleri(DOSYA_DIZINI), time.monotonic())
+    if yarim_dosyalar:
+        zamanlayici.tamamlandi(yarim_dosyalar, time.monotonic())
+    log.info(f"Mevcut dosya sayısı: {len(zamanlayici.izler)}")
     log.info("Bekleniyor...")
 
     try:
         while True:
-            time.sleep(5)  # 5 saniyede bir kontrol
-            current_files = set(dosya_listesi_al(DOSYA_DIZINI))
-
-            yeni = current_files - last_files
-            silinen = last_files - current_files
-
-            if yeni or silinen:
-                # Debounce: dosya kopyalanırken birden fazla değişiklik olabilir
-                log.info(f"Değişiklik algılandı, {DEBOUNCE_SANIYE}s bekleniyor...")
-                time.sleep(DEBOUNCE_SANIYE)
-                # Debounce sonrası tekrar oku (dosya kopyası tamamlanmış olabilir)
-                current_files = set(dosya_listesi_al(DOSYA_DIZINI))
-                yeni = current_files - last_files
-                silinen = last_files - current_files
-
-                if yeni:
-                    log.info(f"YENİ DOSYA:")
-                    for f in yeni:
-                        log.info(f"  + {f}")
-                if silinen:
-                    log.info(f"SİLİNEN DOSYA:")
-                    for f in silinen:
-                        log.info(f"  - {f}")
-
-                log.info("MASTER_DATA güncelleniyor...")
-                master_data_olustur()
-                last_files = current_files
-                log.info("Tamamlandı. Bekleniyor...")
+            istendi = False
+            if servis is not None:
+                istendi = servis.tetik.wait(KONTROL_ARALIGI)
+                if istendi:
+                    servis.tetik.clear()  # Zaman aşımından sonra gelen istek silinmesin
+            else:
+                time.sleep(KONTROL_ARALIGI)
+            simdi = time.monotonic()
+            zamanlayici.olaylari_isle(klasor_izleri(DOSYA_DIZINI), simdi)
+            if servis is not None:
+                servis.bekleyen = len(zamanlayici.bekleyen) + len(zamanlayici.silinen)
+            if not istendi and not zamanlayici.hazir_mi(simdi):
+                continue
+
+            atla = zamanlayici.is_al(simdi)
+            log.info("MASTER_DATA güncelleniyor..." + (" (servis isteği)" if istendi else ""))
+            _, parca = guncelle(onbellek, atla, tutulan=tutulan, kalite_onbellek=kalite_onbellek, servis=servis)
+            zamanlayici.tamamlandi(parca['yarim_dosyalar'] if parca else [], time.monotonic())
+            log.info("Tamamlandı. Bekleniyor...")
 
     except KeyboardInterrupt:
         log.info("İzleme durduruldu.")
+    finally:
+        if servis is not None:
+            servis.kapat()
+
+
+# ============================================================
+# SERVİS MODU (--servis)
+# ============================================================
+# İzleme moduna ek olarak birleştirilmiş veri bellekte tutulur ve yerel bir
+# HTTP ucundan sunulur (yalnızca SERVIS_ADRES, JSON yanıt):
+#   GET  /durum      son derleme, kayıt sayıları, bekleyen değişiklikler
+#   GET  /dosyalar   dosya bazlı ölçümler (kaynak, okuma süresi, kayıt/satır sayısı)
+#   GET  /sorgu      ?tur=plan|ziyaret|siparis&temsilci=&hafta=&musteri=
+#                    &baslangic=GG.AA.YYYY&bitis=GG.AA.YYYY&limit=
+#   POST /guncelle   zamanlayıcıyı beklemeden yeniden derleme ister
+# Sorgular derleme sonrasında kurulan indekslerden yanıtlanır; xlsx açılmaz.
+
+class VeriIndeksi:
+    """Plan/ziyaret/sipariş kayıtları üzerinde temsilci, hafta, müşteri ve tarih indeksleri."""
+
+    def __init__(self, durum):
+        self.kayitlar = {'plan': durum['planlanan'], 'ziyaret': durum['yapilan'], 'siparis': durum['siparis']}
+        self.indeksler = {}
+        for tur, kayitlar in self.kayitlar.items():
+            alanlar = {'temsilci': defaultdict(list), 'hafta': defaultdict(list), 'musteri': defaultdict(list)}
+            tarihler = []
+            for i, rec in enumerate(kayitlar):
+                alanlar['temsilci'][rec['rep']].append(i)
+                alanlar['hafta'][rec['week']].append(i)
+                alanlar['musteri'][normalize_tr(rec['musteri'])].append(i)
+                dt = tarih_cevir(rec['tarih'])
+                if dt:
+                    tarihler.append((dt.toordinal(), i))
+            tarihler.sort()
+            alanlar['tarih'] = tarihler
+            self.indeksler[tur] = alanlar
+
+    def sorgu(self, tur, temsilci=None, hafta=None, musteri=None, baslangic=None, bitis=None):
+        """Filtrelere uyan kayıtları dosya sırasında döndür (verilmeyen filtre uygulanmaz)."""
+        indeks = self.indeksler[tur]
+        adaylar = None
+        for alan, deger in (('temsilci', temsilci), ('hafta', hafta), ('musteri', normalize_tr(musteri or ''))):
+            if deger:
+                kume = set(indeks[alan].get(deger, ()))
+                adaylar = kume if adaylar is None else adaylar & kume
+        if baslangic or bitis:
+            tarihler = indeks['tarih']
+            ilk = bisect.bisect_left(tarihler, (baslangic.toordinal(), -1)) if baslangic else 0
+            son = bisect.bisect_right(tarihler, (bitis.toordinal(), len(tarihler))) if bitis else len(tarihler)
+            kume = {i for _, i in tarihler[ilk:son]}
+            adaylar = kume if adaylar is None else adaylar & kume
+        kayitlar = self.kayitlar[tur]
+        if adaylar is None:
+            return list(kayitlar)
+        return [kayitlar[i] for i in sorted(adaylar)]
+
+
+class VeriServisi:
+    """Servis modunda bellekteki veri kümesi, indeksler ve derleme durumu."""
+
+    def __init__(self):
+        self.kilit = threading.Lock()
+        self.tetik = threading.Event()      # POST /guncelle ile kurulur, izleme döngüsü bekler
+        self.sunucu = None
+        self.baslangic = datetime.now()
+        self.bekleyen = 0
+        self.indeks = None
+        self.bilgi = {'derleme_sayisi': 0, 'son_derleme': None, 'basarili': None, 'sure': None}
+        self.dosyalar = []
+
+    def derleme_bitti(self, basarili, parca, durum, sure):
+        """Derleme sonucunu al; yeni indeksleri kurup tek seferde devreye al."""
+        indeks = VeriIndeksi(durum) if durum is not None else None
+        dosyalar = self.dosya_metrikleri(parca) if parca is not None else None
+        with self.kilit:
+            if indeks is not None:
+                self.indeks = indeks
+                self.bilgi.update({
+                    'haftalar': [h[0] for h in parca['haftalar']], 'temsilciler': parca['temsilciler'],
+                    'kayit': {tur: len(k) for tur, k in indeks.kayitlar.items()},
+                    'musteri': len(durum['musteriler']),
+                    'sorun': len(durum['sorunlar']),
+                })
+            if dosyalar is not None:
+                self.dosyalar = dosyalar
+                self.bilgi['yarim_dosyalar'] = parca['yarim_dosyalar']
+            self.bilgi['derleme_sayisi'] += 1
+            self.bilgi['son_derleme'] = datetime.now().isoformat(timespec='seconds')
+            self.bilgi['basarili'] = basarili
+            self.bilgi['sure'] = round(sure, 3)
+
+    @staticmethod
+    def dosya_metrikleri(parca):
+        """Dosya bazlı ölçümler: nereden alındı, okuma süresi, kayıt ve satır sayıları."""
+        sonuclar = {s['dosya']: s for s in parca['sonuclar']}
+        satirlar = []
+        for fn, olcum in parca['olcumler'].items():
+            s = sonuclar.get(fn)
+            satir = {'dosya': fn, 'kaynak': olcum['kaynak'],
+                     'okuma_suresi': round(olcum['sure'], 4) if olcum['sure'] is not None else None}
+            if s is not None:
+                satir.update({'temsilci': s['rep'], 'hafta': s['week'], 'tip': s['tip'],
+                              'planlanan': len(s['planlanan']), 'yapilan': len(s['yapilan']),
+                              'siparis': len(s['siparis']), 'satir_sayisi': s.get('satir_sayisi'),
+                              'son_veri_satiri': s.get('son_veri_satiri')})
+            satirlar.append(satir)
+        return satirlar
+
+    def durum_bilgisi(self):
+        """GET /durum yanıtı."""
+        with self.kilit:
+            return dict(self.bilgi, dizin=str(DOSYA_DIZINI), baslangic=self.baslangic.isoformat(timespec='seconds'),
+                        bekleyen_degisiklik=self.bekleyen, guncelleme_istendi=self.tetik.is_set())
+
+    def baslat(self, port):
+        """HTTP ucunu arka planda başlat; port kullanılamıyorsa False döndür."""
+        try:
+            self.sunucu = ThreadingHTTPServer((SERVIS_ADRES, port), servis_istek_sinifi(self))
+        except OSError as e:
+            log.error(f"Servis başlatılamadı ({SERVIS_ADRES}:{port}): {e}")
+            return False
+        threading.Thread(target=self.sunucu.serve_forever, daemon=True).start()
+        log.info(f"Servis: http://{SERVIS_ADRES}:{port} (/durum, /dosyalar, /sorgu, POST /guncelle)")
+        return True
+
+    def kapat(self):
+        """HTTP ucunu durdur."""
+        if self.sunucu is not None:
+            self.sunucu.shutdown()
+            self.sunucu.server_close()
+            self.sunucu = None
+
+
+def servis_istek_sinifi(servis):
+    """Verilen servise bağlı HTTP istek işleyici sınıfını üret."""
+
+    class IstekIsleyici(BaseHTTPRequestHandler):
+        def yanit(self, kod, veri):
+            govde = json.dumps(veri, ensure_ascii=False, default=str).encode('utf-8')
+            self.send_response(kod)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(govde)))
+            self.end_headers()
+            self.wfile.write(govde)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == '/durum':
+                return self.yanit(200, servis.durum_bilgisi())
+            if url.path == '/dosyalar':
+                return self.yanit(200, servis.dosyalar)  # Liste her derlemede yenisiyle değiştirilir
+            if url.path != '/sorgu':
+                return self.yanit(404, {'hata': f'Bilinmeyen adres: {url.path}'})
+
+            p = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            tur = p.get('tur', 'ziyaret')
+            if tur not in ('plan', 'ziyaret', 'siparis'):
+                return self.yanit(400, {'hata': "tur 'plan', 'ziyaret' veya 'siparis' olmalı"})
+            tarihler = {}
+            for alan in ('baslangic', 'bitis'):
+                if p.get(alan):
+                    tarihler[alan] = tarih_cevir(p[alan])
+                    if tarihler[alan] is None:
+                        return self.yanit(400, {'hata': f'{alan} tarihi okunamadı: {p[alan]} (GG.AA.YYYY)'})
+            try:
+                limit = int(p.get('limit', SORGU_LIMIT))
+            except ValueError:
+                return self.yanit(400, {'hata': 'limit bir sayı olmalı'})
+            indeks = servis.indeks
+            if indeks is None:
+                return self.yanit(503, {'hata': 'Veri henüz yüklenmedi'})
+            t0 = time.perf_counter()
+            kayitlar = indeks.sorgu(tur, p.get('temsilci'), p.get('hafta'), p.get('musteri'),
+                                    tarihler.get('baslangic'), tarihler.get('bitis'))
+            self.yanit(200, {'tur': tur, 'toplam': len(kayitlar), 'kayitlar': kayitlar[:max(limit, 0)],
+                             'sure_ms': round((time.perf_counter() - t0) * 1000, 2)})
+
+        def do_POST(self):
+            if urlparse(self.path).path != '/guncelle':
+                return self.yanit(404, {'hata': f'Bilinmeyen adres: {self.path}'})
+            servis.tetik.set()
+            self.yanit(202, {'kuyrukta': True})
+
+        def log_message(self, format, *args):
+            log.debug(f"Servis: {self.address_string()} {format % args}")
+
+    return IstekIsleyici
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Saha satış Excel dosyalarından MASTER_DATA oluşturur.')
+    parser.add_argument('--izle', '--watch', action='store_true', help='Klasörü izle, değişiklikte güncelle')
+    parser.add_argument('--map', '--parca', dest='parca', metavar='KLASOR', type=Path,
+                        help='Klasörü tara ve ara sonuç (parça) dosyası yaz')
+    parser.add_argument('--merge', '--birlestir', dest='birlestir', metavar='PARCA', type=Path, nargs='+',
+                        help='Parça dosyalarını birleştirip master raporu oluştur')
+    parser.add_argument('--cikti', type=Path, help='Çıktı dosyası (parça veya master)')
+    parser.add_argument('--tutma', '--retain', type=int, metavar='N', default=TUTULAN_HAFTA,
+                        help='Son N haftayı detaylı tut, eskileri arşive katla')
+    parser.add_argument('--servis', '--daemon', nargs='?', const=SERVIS_PORT, type=int, metavar='PORT',
+                        help=f'İzleme moduna ek olarak veriyi bellekte tut ve {SERVIS_ADRES} üzerinden sorgu ucu aç')
+    parser.add_argument('--soguk', '--cold', action='store_true',
+                        help='Durum dosyasını yok say, tüm dosyaları yeniden oku')
+    args = parser.parse_args(argv)
+    if args.tutma is not None and args.tutma < 1:
+        parser.error('--tutma en az 1 olmalı')
+
+    if args.parca:
+        cikti = args.cikti or DOSYA_DIZINI / f'{args.parca.resolve().name}.parca.jsonl'
+        return parca_olustur(args.parca, cikti)
+    if args.birlestir:
+        return parcalardan_master(args.birlestir, args.cikti or DOSYA_DIZINI / CIKTI_DOSYA)
+    if args.izle or args.servis:
+        # Önce bir kez çalıştır (durum dosyasından), sonra izle; okunan dosyalar önbellekte tutulur
+        servis = None
+        if args.servis:
+            servis = VeriServisi()
+            if not servis.baslat(args.servis):
+                return False
+        onbellek, kalite_onbellek = {}, {}
+        _, parca = master_data_olustur(onbellek, soguk=args.soguk, tutulan=args.tutma,
+                                       kalite_onbellek=kalite_onbellek, servis=servis)
+        izleme_modu(onbellek, args.tutma, kalite_onbellek, servis, parca['yarim_dosyalar'] if parca else ())
+        return True
+    basarili, _ = master_data_olustur(soguk=args.soguk, tutulan=args.tutma)
+    return basarili
 
 
 if __name__ == '__main__':
-    if '--izle' in sys.argv or '--watch' in sys.argv:
-        # Önce bir kez çalıştır, sonra izle
-        master_data_olustur()
-        izleme_modu()
-    else:
-        master_data_olustur()
+    sys.exit(0 if main() else 1)